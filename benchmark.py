@@ -0,0 +1,162 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from classes import Level
+
+# input script which is repeated during the run: frame in cycle -> action
+SCRIPT = {5: ('go', 'right', True), 60: ('go', 'right', False), 70: ('go', 'up', True),
+          80: ('go', 'left', True), 140: ('go', 'left', False), 150: ('rotate', 'left'),
+          200: ('go', 'right', True), 260: ('rotate', 'right'), 300: ('go', 'right', False)}
+CYCLE = 360
+
+
+def synthetic_layout(cells, boxes, seed=0, board_size=700):
+    """board of cells x cells with random blocks and skulls and 'boxes' boxes"""
+    cell_size = board_size // cells
+    rnd = random.Random(seed)
+    free = [(j*cell_size, i*cell_size) for i in range(1, cells-1) for j in range(1, cells-1)]
+    rnd.shuffle(free)
+    player, prize = free.pop(), free.pop()
+    return dict(cell_size=cell_size, xspeed=4, yspeed=10, board_size=cells*cell_size,
+                crds_of_player=player, crds_of_prize=prize,
+                crds_of_boxes=[free.pop() for i in range(boxes)],
+                crds_of_blocks=[free.pop() for i in range(cells*cells//10)],
+                crds_of_skulls=[free.pop() for i in range(cells//2)])
+
+
+CASES = {
+    'level1': dict(lvl_num=1),
+    'level2': dict(lvl_num=2),
+    'level3': dict(lvl_num=3),
+    'synthetic14': dict(lvl_num=0, layout=synthetic_layout(14, 60)),
+    'synthetic28': dict(lvl_num=0, layout=synthetic_layout(28, 300)),
+    'large56': dict(lvl_num=0, layout=synthetic_layout(56, 600, board_size=2800)),
+    'large112': dict(lvl_num=0, layout=synthetic_layout(112, 2400, board_size=5600)),
+}
+
+
+def percentiles(times, scale=1000):
+    """returns statistics of times in milliseconds, other values are multiplied by 'scale' instead"""
+    if not times:
+        return {}
+
+    times = sorted(t*scale for t in times)
+    pick = lambda p: times[min(len(times)-1, int(p*len(times)))]
+    return {'mean': sum(times)/len(times), 'p50': pick(0.5), 'p95': pick(0.95),
+            'p99': pick(0.99), 'max': times[-1], 'count': len(times)}
+
+
+def run_case(lvl_num, frames, layout=None, numpy_physics=False, allocations=False):
+    """
+        with 'allocations' every update runs under tracemalloc, 'allocated' are bytes
+        which it has allocated at its peak, 'kept' are bytes still held after it
+    """
+    level = Level(lvl_num, layout=layout)
+
+    if numpy_physics:
+        level.use_numpy_physics()
+
+    update, draw, rotate, allocated, kept = [], [], [], [], []
+
+    if allocations:
+        tracemalloc.start()
+
+    for frame in range(frames):
+        action = SCRIPT.get(frame % CYCLE)
+
+        if action:
+            level.apply(action)
+
+        rotating = level.is_rotating()
+
+        t = time.perf_counter()
+        level.draw()
+        draw.append(time.perf_counter() - t)
+
+        if allocations:
+            tracemalloc.clear_traces()
+
+        t = time.perf_counter()
+        level.step()
+        update.append(time.perf_counter() - t)
+
+        if allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            allocated.append(peak)
+            kept.append(current)
+
+        if rotating:
+            rotate.append(draw[-1] + update[-1])
+
+    if allocations:
+        tracemalloc.stop()
+
+    return {'update': percentiles(update), 'draw': percentiles(draw), 'rotate': percentiles(rotate),
+            'allocated': percentiles(allocated, scale=1), 'kept': percentiles(kept, scale=1)}
+
+
+def check_budgets(results, budgets):
+    """returns list of messages about statistics which exceed the budgets"""
+    failures = []
+
+    for case, limits in budgets.items():
+        for key, limit in limits.items():
+            part, stat = key.split('_')
+            value = results.get(case, {}).get(part, {}).get(stat)
+
+            if value is not None and value > limit:
+                failures.append('%s %s = %.3f ms > %.3f ms' % (case, key, value, limit))
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='frame time benchmark of levels')
+    parser.add_argument('cases', nargs='*', default=sorted(CASES))
+    parser.add_argument('--frames', type=int, default=CYCLE*2)
+    parser.add_argument('--numpy-physics', action='store_true',
+                        help='batched NumpyPhysics backend, it gives the same trajectories and is slower')
+    parser.add_argument('--allocations', action='store_true',
+                        help='count bytes allocated by every update, times are slower and not checked against budgets')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--budgets', default='benchmark_budgets.json',
+                        help='json file {case: {"update_p95": ms, "draw_p95": ms, ...}}')
+    args = parser.parse_args()
+
+    results = {}
+
+    for case in args.cases:
+        results[case] = run_case(frames=args.frames, numpy_physics=args.numpy_physics, allocations=args.allocations, **CASES[case])
+        print('%-12s update p50 %.3f p95 %.3f  draw p50 %.3f p95 %.3f  rotating frame p95 %.3f ms' % (
+            case, results[case]['update']['p50'], results[case]['update']['p95'],
+            results[case]['draw']['p50'], results[case]['draw']['p95'],
+            results[case]['rotate'].get('p95', 0)))
+
+        if args.allocations:
+            print('%-12s allocated per update p50 %d p95 %d max %d  kept p95 %d bytes' % (
+                case, results[case]['allocated']['p50'], results[case]['allocated']['p95'],
+                results[case]['allocated']['max'], results[case]['kept']['p95']))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    budgets = {}
+
+    if os.path.exists(args.budgets):
+        with open(args.budgets) as f:
+            budgets = json.load(f)
+
+    # tracemalloc slows every allocation down and budgets are set for the default backend,
+    # so such times say nothing about the budgets
+    failures = check_budgets(results, budgets) if not (args.allocations or args.numpy_physics) else []
+
+    for message in failures:
+        print('over budget:', message)
+
+    sys.exit(1 if failures else 0)
@@ -1,81 +1,904 @@
 import pygame
-import cv2
 import numpy as np
-from tkinter import Tk, Scale, HORIZONTAL
-from threading import Thread
+from threading import Thread, Event
+from multiprocessing import Pool
+from collections import OrderedDict, deque
+import os
+import json
 import time
-from math import fabs, cos, sin, pi, atan
+import hashlib
+from math import fabs, copysign, cos, sin, pi, atan
+
+# state shared with the computer vision threads
+visio = None
+visio_control = quit_cv = False
+# OpenCV is imported by import_cv() when the camera is used for the first time
+cv2 = None
+
+
+def import_cv():
+    """imports OpenCV once, so players who never turn the camera on don't wait for it"""
+    global cv2
+
+    if cv2 is None:
+        import cv2 as module
+        cv2 = module
+
+    return cv2
+
+
+class Assets(object):
+    """
+       process-wide image cache: every file is decoded once and converted to the
+       display format, scaled copies are kept until there are too many of them
+    """
+    def __init__(self, max_scaled=64):
+        self._images = {}
+        self._scaled = OrderedDict()
+        self._max_scaled = max_scaled
+        self._decoded = {}
+        self._pending = {}
+
+    def preload(self, *names):
+        """decodes files in a background thread, load() takes the results or waits for them"""
+        names = [name for name in names if name not in self._pending and (name, True) not in self._images
+                 and (name, False) not in self._images]
+
+        pending = [(name, Event()) for name in names]
+        self._pending.update(pending)
+        Thread(target=self._decode, args=(pending,), daemon=True).start()
+
+    def _decode(self, pending):
+        for name, done in pending:
+            try:
+                self._decoded[name] = pygame.image.load(name)
+            finally:
+                done.set()
+
+    def load(self, name, convert=True):
+        """
+            returns image from file 'name', it is converted as soon as display mode is set,
+            'convert=False' keeps it as it was decoded (e.g. for the window icon)
+        """
+        image, converted = self._images.get((name, convert), (None, False))
+
+        if image is None:
+            pending = self._pending.pop(name, None)
+
+            if pending is not None:
+                pending.wait()
+
+            image = self._decoded.pop(name, None)
+
+        if image is None:
+            image = pygame.image.load(name)
+
+        if convert and not converted and pygame.display.get_surface() is not None:
+            image = image.convert_alpha() if name.endswith('.png') else image.convert()
+            converted = True
+
+        self._images[name, convert] = image, converted
+        return image
+
+    def scaled(self, name, size):
+        """returns image from file 'name' scaled to 'size', the least recently used copies are evicted"""
+        image = self.load(name)
+        key = name, tuple(size), image.get_flags(), image.get_bitsize()
+        scaled = self._scaled.get(key)
+
+        if scaled is None:
+            scaled = pygame.transform.scale(image, size)
+            self._scaled[key] = scaled
+
+            if len(self._scaled) > self._max_scaled:
+                self._scaled.popitem(last=False)
+        else:
+            self._scaled.move_to_end(key)
+
+        return scaled
+
+
+assets = Assets()
+
+
+class Window(object):
+    """
+       process-wide window and clock: pygame is initialized and the display mode is set once,
+       every game which is created later draws on the same screen
+    """
+    def __init__(self):
+        self._screen = None
+        self._clock = None
+        self._icon = None
+
+    def open(self, size, caption):
+        """returns the screen, the window is created on the first call"""
+        if self._screen is None:
+            pygame.init()
+            self._screen = pygame.display.set_mode(size)
+            pygame.display.set_caption(caption)
+
+        return self._screen
+
+    def set_icon(self, name, colorkey):
+        """sets the icon of the window once, its file may still be decoded in the background"""
+        if self._icon is None:
+            self._icon = assets.load(name, convert=False)
+            self._icon.set_colorkey(colorkey)
+            pygame.display.set_icon(self._icon)
+
+    def get_clock(self):
+        if self._clock is None:
+            self._clock = pygame.time.Clock()
+
+        return self._clock
+
+
+window = Window()
+
+
+class LevelLoader(object):
+    """
+       reads levels from files '<number>.json' of a directory, each of them holds keyword arguments
+       of Level.setup, a file is parsed only when its level is asked for the first time
+    """
+    def __init__(self, path='levels'):
+        self._path = path
+        self._layouts = {}
+
+    def numbers(self):
+        """returns numbers of all levels in the directory, files are not read"""
+        names = (os.path.splitext(name) for name in os.listdir(self._path))
+        return sorted(int(number) for number, ext in names if ext == '.json' and number.isdigit())
+
+    def get(self, lvl_num):
+        """returns layout of the level, coords are tuples so it can be shared"""
+        layout = self._layouts.get(lvl_num)
+
+        if layout is None:
+            with open(os.path.join(self._path, '%d.json' % lvl_num)) as f:
+                layout = self._layouts[lvl_num] = {key: self._freeze(value) for key, value in json.load(f).items()}
+
+        return layout
+
+    def _freeze(self, value):
+        return tuple(self._freeze(item) for item in value) if isinstance(value, list) else value
+
+
+levels = LevelLoader()
+
+
+class Profiler(object):
+    """
+       ring buffer of the last 'capacity' frames: time of every stage of a frame in ms
+       and number of collision checks, a stage gets the time since the previous mark,
+       so every mark costs one call of the timer, 'path' is where export puts the data,
+       stages: input events, camera aim, static groups, dynamic groups, display update, physics
+    """
+    STAGES = ('events', 'aim', 'static', 'dynamic', 'display', 'update')
+
+    def __init__(self, capacity=600, path='profile.json'):
+        self._frames = np.zeros((capacity, len(self.STAGES) + 1))
+        self._columns = {stage: i for i, stage in enumerate(self.STAGES)}
+        self._count = 0
+        self._row = [0.0]*len(self.STAGES)
+        self._mark = time.perf_counter()
+        self._path = path
+
+    def begin(self):
+        self._row = [0.0]*len(self.STAGES)
+        self._mark = time.perf_counter()
+
+    def lap(self, stage):
+        """adds the time since the previous mark to 'stage' of the current frame"""
+        now = time.perf_counter()
+        self._row[self._columns[stage]] += (now - self._mark)*1000
+        self._mark = now
+
+    def end(self, checks=0):
+        self._frames[self._count % len(self._frames)] = self._row + [checks]
+        self._count += 1
+
+    def get_count(self):
+        """returns how many frames have ended so far"""
+        return self._count
+
+    def get_frames(self):
+        """returns the kept frames from the oldest one as rows of stage times and the number of checks"""
+        if self._count <= len(self._frames):
+            return self._frames[:self._count]
+
+        return np.roll(self._frames, -(self._count % len(self._frames)), axis=0)
+
+    def summary(self):
+        """returns {stage or 'frame' or 'checks': {'p50': .., 'p95': .., 'p99': ..}} over the kept frames"""
+        frames = self.get_frames()
+
+        if not len(frames):
+            return {}
+
+        columns = dict(zip(self.STAGES, frames.T))
+        columns['frame'] = frames[:, :-1].sum(axis=1)
+        columns['checks'] = frames[:, -1]
+        return {name: dict(zip(('p50', 'p95', 'p99'), np.percentile(values, (50, 95, 99)).round(3).tolist()))
+                for name, values in columns.items()}
+
+    def export(self, path=None):
+        """writes the summary and all kept frames to a json file, returns its path"""
+        path = path or self._path
+
+        with open(path, 'w') as f:
+            json.dump({'stages': self.STAGES + ('checks',), 'summary': self.summary(),
+                       'frames': self.get_frames().round(4).tolist()}, f)
+
+        return path
+
+
+profiler = Profiler()
 
 
 class Group(object):
     """
        group class allows keep objects which belong to some group
-       for example: moving sprites, danger objects etc
+       for example: moving sprites, danger objects etc,
+       members are kept in the order of adding in a dict, so add and remove take O(1)
     """
     def __init__(self):
-        self._list = set()
+        self._members = {}
+        self._layers = {}
+        self._snapshot = ()
 
     def get(self):
-        return self._list
+        """returns members as a set-like view, it changes together with the group"""
+        return self._members.keys()
+
+    def snapshot(self):
+        """returns members as a tuple which stays the same while objects leave the group, it is cached till a change"""
+        if self._snapshot is None:
+            self._snapshot = tuple(self._members)
+
+        return self._snapshot
+
+    def layer(self, layer):
+        """returns members which belong to the collision 'layer' (one of Object.LAYERS)"""
+        return self._layers.get(layer, {}).keys()
 
     def add(self, *sprites, t=False):
         """Add objects to this group. 't' uses when we give tuple of objects"""
-        if t: 
-            self._list = self._list ^ set(t)
+        for obj in t or sprites:
+            if obj in self._members: continue
 
-            for obj in t:
-                obj.add_container(self)
-        else:
-            self._list.update(sprites)
-            
-            for obj in sprites:
-                obj.add_container(self)
+            self._members[obj] = None
+            obj.add_container(self)
+
+            for layer in obj.get_layers():
+                self._layers.setdefault(layer, {})[obj] = None
+
+        self._snapshot = None
 
     def remove(self, sprite):
-        self._list = self._list^{sprite}
+        if sprite not in self._members: return
+
+        del self._members[sprite]
+
+        for layer in sprite.get_layers():
+            del self._layers[layer][sprite]
+
+        self._snapshot = None
+
+    def clear(self):
+        self._members = {}
+        self._layers = {}
+        self._snapshot = ()
+
+    def move(self, sprite):
+        """group doesn't keep positions, so there is nothing to patch"""
+        pass
 
-    def draw(self, place):
-        for sprite in self._list:
-            place.blit(sprite.get_image(), sprite.get_coords())
+    @staticmethod
+    def blit_list(sprites, offset=(0, 0)):
+        """returns (image, position) of every sprite shifted by 'offset' in one list, as Surface.blits takes them"""
+        ox, oy = offset
+        blits = []
+
+        for sprite in sprites:
+            x, y = sprite.get_coords()
+            blits.append((sprite.get_image(), (x - ox, y - oy)))
+
+        return blits
+
+    def draw(self, place, offset=(0, 0)):
+        place.blits(self.blit_list(self.snapshot(), offset), doreturn=False)
 
     def update(self):
-        for sprite in self._list:
+        """members may leave the group meanwhile, e.g. when they die"""
+        for sprite in self.snapshot():
             sprite.update()
 
 
+class SpatialHash(object):
+    """
+       uniform grid which keeps objects in every cell they overlap,
+       so collision checks look only at the neighbouring objects,
+       with a mask of 'layers' every collision layer gets its own cells and queries take one of them,
+       objects out of the mask aren't kept, without it all objects share the cells
+    """
+    def __init__(self, cell_size, layers=None):
+        self._cell_size = cell_size
+        self._layers = layers
+        self._cells = {}
+        self._columns = {}
+        self._spans = {}
+
+    def span(self, sprite):
+        """returns (first column, last column, first row, last row) covered by sprite"""
+        return self.box_span(*sprite.get_bounds())
+
+    def box_span(self, left, top, right, bottom):
+        """
+            returns (first column, last column, first row, last row) covered by the box (left, top, right, bottom),
+            a cell which the box only touches by an edge isn't covered, objects which only touch never collide,
+            so an object on the grid lines takes one cell and not four, boxes must have non zero sizes
+        """
+        c = self._cell_size
+        return int(left//c), -int(-right//c) - 1, int(top//c), -int(-bottom//c) - 1
+
+    def add(self, *sprites, t=False):
+        """Add objects to this hash. 't' uses when we give tuple of objects"""
+        for obj in t or sprites:
+            layers = (None,) if self._layers is None else tuple(layer for layer in obj.get_layers() if layer & self._layers)
+
+            if layers:
+                self._insert(obj, self.span(obj), layers)
+                obj.add_container(self)
+
+    def remove(self, sprite):
+        span, layers = self._spans.pop(sprite, (None, None))
+        if span is None: return
+
+        j0, j1, i0, i1 = span
+
+        for layer in layers:
+            for j in range(j0, j1+1):
+                self._columns[layer, j].discard(sprite)
+
+                for i in range(i0, i1+1):
+                    self._cells[layer, i, j].discard(sprite)
+
+    def move(self, sprite):
+        """patches cells of the sprite after it has changed its coords"""
+        span = self.box_span(*sprite.get_bounds())
+        old, layers = self._spans.get(sprite, (span, None))
+
+        if old != span:
+            self.remove(sprite)
+            self._insert(sprite, span, layers)
+
+    def _insert(self, sprite, span, layers):
+        j0, j1, i0, i1 = span
+        self._spans[sprite] = span, layers
+
+        for layer in layers:
+            for j in range(j0, j1+1):
+                self._columns.setdefault((layer, j), set()).add(sprite)
+
+                for i in range(i0, i1+1):
+                    self._cells.setdefault((layer, i, j), set()).add(sprite)
+
+    def query_box(self, left, top, right, bottom, layer=None):
+        """returns objects from the cells which the box (left, top, right, bottom) overlaps"""
+        j0, j1, i0, i1 = self.box_span(left, top, right, bottom)
+        found = set()
+
+        for j in range(j0, j1+1):
+            for i in range(i0, i1+1):
+                found.update(self._cells.get((layer, i, j), ()))
+
+        return found
+
+    def cells(self, sprite, layer=None):
+        """yields cells which sprite overlaps, an object may be met in several of them"""
+        j0, j1, i0, i1 = self.span(sprite)
+
+        for j in range(j0, j1+1):
+            for i in range(i0, i1+1):
+                cell = self._cells.get((layer, i, j))
+                if cell: yield cell
+
+    def box_cells(self, left, top, right, bottom, layer=None):
+        """yields cells which the box (left, top, right, bottom) overlaps, an object may be met in several of them"""
+        j0, j1, i0, i1 = self.box_span(left, top, right, bottom)
+
+        for j in range(j0, j1+1):
+            for i in range(i0, i1+1):
+                cell = self._cells.get((layer, i, j))
+                if cell: yield cell
+
+    def columns(self, sprite, layer=None):
+        """yields columns which sprite overlaps, an object may be met in several of them"""
+        j0, j1, _, _ = self.span(sprite)
+
+        for j in range(j0, j1+1):
+            column = self._columns.get((layer, j))
+            if column: yield column
+
+
+class Portals(object):
+    """
+       registry of the portals of the level, any number of pairs: portals which overlap every column,
+       that is the lookup on_portal needs, it follows portals as they move,
+       a portal sends objects to the place of its twin, so twins stay right after any turn of the board
+    """
+    def __init__(self, cell_size):
+        self._cell_size = cell_size
+        self._columns = {}
+        self._places = {}
+
+    @staticmethod
+    def pair(portal, twin):
+        portal.set_twin(twin)
+        twin.set_twin(portal)
+
+    def _place(self, portal):
+        left, _, right, _ = portal.get_bounds()
+        c = self._cell_size
+        return range(int(left//c), int(right//c)+1)
+
+    def add(self, *sprites, t=False):
+        """Add portals to this registry. 't' uses when we give tuple of objects"""
+        for portal in t or sprites:
+            self._insert(portal, self._place(portal))
+            portal.add_container(self)
+
+    def remove(self, sprite):
+        columns = self._places.pop(sprite, None)
+        if columns is None: return
+
+        for j in columns:
+            self._columns[j].remove(sprite)
+
+    def move(self, sprite):
+        place = self._place(sprite)
+
+        if self._places.get(sprite, place) != place:
+            self.remove(sprite)
+            self._insert(sprite, place)
+
+    def _insert(self, portal, columns):
+        self._places[portal] = columns
+
+        for j in columns:
+            self._columns.setdefault(j, []).append(portal)
+
+    def column(self, sprite):
+        """returns portals which overlap sprite along x axis"""
+        if not self._places:
+            return ()
+
+        left, _, right, _ = sprite.get_bounds()
+        c = self._cell_size
+        found = ()
+
+        for j in range(int(left//c), int(right//c)+1):
+            for portal in self._columns.get(j, ()):
+                if sprite.check_column(portal) and portal not in found:
+                    found += (portal,)
+
+        return found
+
+
+class Board(object):
+    """
+       persistent cell occupancy of the level: (row, column) cell of every object in one (n, 2) numpy array,
+       it follows objects as they move, so a rotation turns all cells in one vectorized pass
+    """
+    def __init__(self, cell_size, cells):
+        self._cell_size = cell_size
+        self._last = cells - 1
+        self._sprites = []
+        self._rows = {}
+        self._cells = np.zeros((0, 2), dtype=int)
+        self._alive = np.zeros(0, dtype=bool)
+
+    def cell(self, sprite):
+        """returns (row, column) of the cell which sprite is nearest to"""
+        x, y = sprite.get_coords()
+        up = self._cell_size - self._cell_size//2
+        return int((y + up)//self._cell_size), int((x + up)//self._cell_size)
+
+    def add(self, *sprites, t=False):
+        """Add objects to this board. 't' uses when we give tuple of objects"""
+        added = t or sprites
+
+        for row, obj in enumerate(added, len(self._sprites)):
+            self._rows[obj] = row
+            self._sprites.append(obj)
+            obj.add_container(self)
+
+        cells = np.array([self.cell(obj) for obj in added], dtype=int).reshape(-1, 2)
+        self._cells = np.concatenate((self._cells, cells))
+        self._alive = np.concatenate((self._alive, np.ones(len(added), dtype=bool)))
+
+    def remove(self, sprite):
+        row = self._rows.pop(sprite, None)
+        if row is not None:
+            self._alive[row] = False
+
+    def move(self, sprite):
+        row = self._rows.get(sprite)
+        if row is not None:
+            self._cells[row] = self.cell(sprite)
+
+    def rotate(self, side):
+        """
+            turns the board by 90 degrees to the 'side', returns objects with their
+            current cell coords and target coords as (n, 2) arrays of (x, y)
+        """
+        rows = np.flatnonzero(self._alive)
+        cells = self._cells[rows]
+
+        if side == 'right':
+            turned = np.stack((cells[:, 1], self._last - cells[:, 0]), axis=1)
+        else:
+            turned = np.stack((self._last - cells[:, 1], cells[:, 0]), axis=1)
+
+        self._cells[rows] = turned
+        sprites = [self._sprites[row] for row in rows.tolist()]
+        return sprites, cells[:, ::-1]*self._cell_size, turned[:, ::-1]*self._cell_size
+
+    def digest(self):
+        """
+            returns a short digest of the cells of all present objects, states of the level which put objects
+            into the same cells give the same digest, orientation and portals are there as cells of static objects
+        """
+        cells = np.where(self._alive[:, None], self._cells, -1)
+        return hashlib.blake2b(cells.tobytes(), digest_size=8).digest()
+
+
+class Physics(object):
+    """
+       default collision backend, it checks objects one by one
+       and takes candidates from the spatial hash of the level
+       and from the registry of 'portals'
+    """
+    def __init__(self, sprites_hash, portals=None):
+        self._hash = sprites_hash
+        self._portals = portals
+        self._checks = 0
+
+    def step(self, bodies):
+        """updates 'bodies' for one frame in their order"""
+        for body in bodies:
+            body.update()
+
+    def take_checks(self):
+        """returns number of collision queries since the previous call"""
+        checks, self._checks = self._checks, 0
+        return checks
+
+    def sweep(self, sprite, dx, dy):
+        """
+            returns how far sprite really moves when it goes by (dx, dy) along one axis: the way till
+            the first solid object it touches, candidates come from the cells of the whole swept box,
+            so a fast body stops at a wall instead of jumping over it
+        """
+        self._checks += 1
+        left, top, right, bottom = sprite.get_bounds()
+        distance = fabs(dx or dy)
+
+        # an object met in several cells can't change the minimum
+        for cell in self._hash.box_cells(left + min(dx, 0), top + min(dy, 0), right + max(dx, 0), bottom + max(dy, 0), Object.SOLID):
+            for other in cell:
+                if other is not sprite:
+                    gap = sprite.gap_to(other, dx, dy)
+                    if gap is not None and gap < distance: distance = gap
+
+        return copysign(distance, dx or dy)
+
+    def floats(self, sprite):
+        """checks if there is a solid object above or below sprite which doesn't touch it"""
+        self._checks += 1
+        for column in self._hash.columns(sprite, Object.SOLID):
+            for other in column:
+                if other is not sprite and sprite.check_column(other) and sprite.check_apart(other):
+                    return True
+        return False
+
+    def dangers(self, sprite):
+        """returns danger objects which sprite overlaps"""
+        self._checks += 1
+        found = ()
+
+        for cell in self._hash.cells(sprite, Object.DANGER):
+            for other in cell:
+                if sprite.check_barrier(other) and other not in found:
+                    found += (other,)
+
+        return found
+
+    def portals(self, sprite):
+        """returns portals which lie in the same column as sprite"""
+        return self._portals.column(sprite) if self._portals is not None else ()
+
+    def prizes(self, sprite):
+        """returns prizes which sprite overlaps"""
+        self._checks += 1
+        found = ()
+
+        for cell in self._hash.cells(sprite, Object.PRIZE):
+            for other in cell:
+                if sprite.check_barrier(other) and other not in found:
+                    found += (other,)
+
+        return found
+
+    def wake_near(self, left, top, right, bottom):
+        """
+            wakes sleeping objects which touch the box (left, top, right, bottom), e.g. where a body has been,
+            only they can lose their support or way, so the box is widened by a pixel and not by cells
+        """
+        for cell in self._hash.box_cells(left - 1, top - 1, right + 1, bottom + 1, Object.DYNAMIC):
+            for other in cell:
+                if other.is_asleep(): other.wake()
+
+
+class NumpyPhysics(Physics):
+    """
+       opt-in collision backend which resolves the bodies of a frame in one batched step:
+       a body whose column strip no other dynamic object or portal can reach during the frame
+       touches only static objects, so such bodies are moved together by vectorized passes
+       over (bodies x static objects) numpy arrays, the others are updated one by one
+       with the queries of Physics in their order, both give the same trajectories as Physics,
+       the batch pays for numpy calls, so on the small levels of the game it is slower
+    """
+    def __init__(self, sprites_hash, portals=None):
+        super(NumpyPhysics, self).__init__(sprites_hash, portals)
+        self._sprites = []
+        self._rows = {}
+        self._coords = np.zeros((0, 2))
+        self._halves = np.zeros((0, 2))
+        self._masks = np.zeros(0, dtype=int)
+        self._alive = np.zeros(0, dtype=bool)
+        self._reach = 1
+
+    def add(self, *sprites, t=False):
+        """Add objects to this backend. 't' uses when we give tuple of objects"""
+        added = t or sprites
+
+        for row, obj in enumerate(added, len(self._sprites)):
+            self._rows[obj] = row
+            self._sprites.append(obj)
+            obj.add_container(self)
+
+            if isinstance(obj, Dynamic):
+                self._reach = max(self._reach, obj.get_xspeed() + 1)
+
+        self._coords = np.concatenate((self._coords, np.array([obj.get_coords() for obj in added], dtype=float).reshape(-1, 2)))
+        self._halves = np.concatenate((self._halves, np.array([(obj._hx, obj._hy) for obj in added], dtype=float).reshape(-1, 2)))
+        self._masks = np.concatenate((self._masks, np.array([obj.get_mask() for obj in added], dtype=int)))
+        self._alive = np.concatenate((self._alive, np.ones(len(added), dtype=bool)))
+
+    def remove(self, sprite):
+        row = self._rows.pop(sprite, None)
+        if row is not None:
+            self._alive[row] = False
+
+    def move(self, sprite):
+        row = self._rows.get(sprite)
+        if row is not None:
+            self._coords[row] = sprite.get_coords()
+
+    def _layer(self, layer, static=True):
+        """returns (x, y, hx, hy) arrays of present objects of the layer, only static ones with 'static'"""
+        mask = self._alive & (self._masks & layer != 0)
+        if static: mask &= self._masks & Object.DYNAMIC == 0
+        (x, y), (hx, hy) = self._coords[mask].T, self._halves[mask].T
+        return x, y, hx, hy
+
+    def _isolated(self, bodies):
+        """returns the bodies which no other dynamic object or portal can come near during the frame"""
+        x, y, hx, hy = self._layer(Object.DYNAMIC | Object.PORTAL, static=False)
+        rows = np.array([self._rows.get(body, -1) for body in bodies], dtype=int)
+        bx, bhx = self._coords[rows, 0], self._halves[rows, 0]
+        # every object may go by 'reach' to the other, a pixel more wakes sleeping ones
+        near = np.abs((bx + bhx)[:, None] - (x + hx)) < bhx[:, None] + hx + 2*self._reach
+        return [body for body, count in zip(bodies, near.sum(axis=1).tolist()) if count == 1]
+
+    def _sweep(self, x, y, hx, hy, d, along_x, solids):
+        """Physics.sweep of every body of the batch by 'd' along one axis against the static solid objects"""
+        sx, sy, shx, shy = solids
+        cx, cy, ocx, ocy = (x + hx)[:, None], (y + hy)[:, None], sx + shx, sy + shy
+
+        if along_x:
+            apart = np.abs(cy - ocy) >= hy[:, None] + shy - Object.EPSILON
+            ahead, size = ocx - cx, shx + hx[:, None]
+        else:
+            apart = np.abs(cx - ocx) >= hx[:, None] + shx - Object.EPSILON
+            ahead, size = ocy - cy, shy + hy[:, None]
+
+        ahead = np.where(d[:, None] < 0, -ahead, ahead)
+        gaps = np.where(~apart & (ahead > Object.EPSILON - size), np.maximum(ahead - size, 0), np.inf)
+        return np.copysign(np.minimum(np.abs(d), gaps.min(axis=1, initial=np.inf)), d)
+
+    def step(self, bodies):
+        """
+            isolated awake bodies with the plain Dynamic.update are moved by one batch,
+            the rest, e.g. the player and bodies near each other, are updated by Physics
+        """
+        batch = self._isolated([body for body in bodies if type(body).update is Dynamic.update
+                                and not body.is_asleep() and not body.check_danger() and not body._on_portal])
+        if batch:
+            self._checks += len(batch)
+            self._step_batch(batch)
+
+        batched = set(batch)
+        super(NumpyPhysics, self).step([body for body in bodies if body not in batched])
+
+    def _step_batch(self, batch):
+        """Dynamic.update of all bodies of the batch at once, they touch only static objects"""
+        LEFT, RIGHT, DOWN, UP = Dynamic._LEFT, Dynamic._RIGHT, Dynamic._DOWN, Dynamic._UP
+        state = np.array([(body._x, body._y, body._hx, body._hy, body._moves, body._yspeed, body._YSPEED,
+                           body._xspeed, body._gravity, body._ground) for body in batch], dtype=float)
+        x0, y0, hx, hy, moves0, yspeed0, top, xspeed, gravity, ground = state.T
+        moves, yspeed, x, y = moves0.astype(int), yspeed0.copy(), x0.copy(), y0.copy()
+        landed, swept_x, swept_y = (np.zeros(len(batch), dtype=bool) for _ in range(3))
+        solids = self._layer(Object.SOLID)
+        zero = np.zeros(len(batch))
+
+        walking = moves & UP == 0
+        for side, sign in ((RIGHT, 1), (LEFT, -1)):
+            go = walking & (moves & side != 0)
+            if go.any():
+                x = np.where(go, x + self._sweep(x, y, hx, hy, np.where(go, sign*xspeed, zero), True, solids), x)
+                swept_x |= go
+
+        jumping = moves & UP != 0
+        if jumping.any():
+            dy = np.where(jumping, -yspeed, zero)
+            yspeed = np.where(jumping, yspeed - gravity, yspeed)
+            moved = self._sweep(x, y, hx, hy, dy, False, solids)
+            y = np.where(jumping, y + moved, y)
+            swept_y |= jumping
+            stopped = jumping & (moved != dy)
+            moves = np.where(stopped, moves & ~UP, moves)
+            yspeed = np.where(stopped, 0, yspeed)
+
+            # a jump goes to the right only if it didn't go to the left
+            sides = moves.copy()
+            for side, sign, skip in ((LEFT, -1, 0), (RIGHT, 1, LEFT)):
+                go = jumping & (sides & side != 0) & (sides & skip == 0)
+                if go.any():
+                    dx = np.where(go, sign*(xspeed//1.5), zero)
+                    moved = self._sweep(x, y, hx, hy, dx, True, solids)
+                    x = np.where(go, x + moved, x)
+                    swept_x |= go
+                    moves = np.where(go & (moved != dx), moves & ~side, moves)
+
+        falling = ~jumping & (moves & DOWN != 0)
+        if falling.any():
+            dy = np.where(falling, yspeed, zero)
+            yspeed = np.where(falling, yspeed + gravity, yspeed)
+            moved = self._sweep(x, y, hx, hy, dy, False, solids)
+            y = np.where(falling, y + moved, y)
+            swept_y |= falling
+            landed = falling & (moved != dy)
+            moves = np.where(landed, moves & ~DOWN, moves)
+            ground = np.where(landed, y + hy, ground)
+
+        standing = moves & (DOWN | UP) == 0
+        if standing.any():
+            sx, sy, shx, shy = solids
+            floats = (np.abs((x + hx)[:, None] - (sx + shx)) < hx[:, None] + shx) & (np.abs((y + hy)[:, None] - (sy + shy)) > hy[:, None] + shy)
+            floats = standing & floats.any(axis=1)
+            yspeed = np.where(floats, top, yspeed)
+            moves = np.where(floats, moves | DOWN, moves)
+
+        yspeed = np.minimum(yspeed, top)
+        dx, dy, dhx, dhy = self._layer(Object.DANGER)
+        dead = ((np.abs((x + hx)[:, None] - (dx + dhx)) < hx[:, None] + dhx) &
+                (np.abs((y + hy)[:, None] - (dy + dhy)) < hy[:, None] + dhy)).any(axis=1)
+        moved = (x != x0) | (y != y0)
+        asleep = ~moved & (moves == moves0) & (yspeed == yspeed0) & (moves0.astype(int) & (LEFT | RIGHT | UP) == 0)
+
+        # coords which weren't swept are left as they are, so ints stay ints like in Dynamic.update
+        for body, values in zip(batch, zip(x.tolist(), y.tolist(), swept_x.tolist(), swept_y.tolist(), moves.tolist(),
+                                           yspeed.tolist(), ground.tolist(), landed.tolist(), moved.tolist(),
+                                           dead.tolist(), asleep.tolist())):
+            x, y, swept_x, swept_y, body._moves, body._yspeed, ground, landed, moved, dead, asleep = values
+            body._prev_x, body._prev_y = body._x, body._y
+            if swept_x: body._x = x
+            if swept_y: body._y = y
+            if landed:
+                body._on_floor = True
+                body._ground = ground
+
+            if moved: body.reindex()
+
+            if dead:
+                body._is_dead = True
+                body.die()
+
+            if asleep and body._SLEEPY:
+                body._asleep = True
+
+
 class Object():
+    """
+       base of all level objects, its state lives in slots instead of dicts,
+       so collision checks don't allocate anything, '_STATE' names slots which change during the game,
+       hash comes from the initial coords, so sets of objects are iterated in the same order in every run
+       '_LAYER' is the mask of collision layers of the class, danger objects are in the DANGER layer as well
+    """
+    __slots__ = ('_x', '_y', '_size', '_hx', '_hy', '_half_size', '_on_floor',
+                 '_image', '_danger', '_is_dead', '_containers', '_hash', '_mask', '_layers')
+    _STATE = ('_x', '_y', '_on_floor', '_is_dead')
+    SOLID, DANGER, PORTAL, PRIZE, DYNAMIC = 1, 2, 4, 8, 16
+    LAYERS = (SOLID, DANGER, PORTAL, PRIZE, DYNAMIC)
+    EPSILON = 1e-6  # rounding error of float coords, objects which overlap less only touch each other
+    _LAYER = 0
+
     def __init__(self, size, coords, image, danger):
         super(Object, self).__init__()
         self._x = coords[0]
         self._y = coords[1]
         self._size = size
-        self._half_size = {'x': self._size[0]//2, 'y': self._size[1]//2}
-        self._center = {'x': self._x + self._half_size['x'], 'y': self._y + self._half_size['y']}
+        self._hx = self._size[0]//2
+        self._hy = self._size[1]//2
+        self._half_size = {'x': self._hx, 'y': self._hy}
         self._on_floor = False
-        self._image = pygame.transform.scale(image, self._size)
+        self._image = image if image.get_size() == tuple(self._size) else pygame.transform.scale(image, self._size)
         self._danger = danger
         self._is_dead = False
         self._containers = []
+        self._hash = hash((coords[0], coords[1]))
+        self._mask = self._LAYER | (self.DANGER if danger else 0)
+        self._layers = tuple(layer for layer in self.LAYERS if layer & self._mask)
+
+    def __hash__(self):
+        return self._hash
                 
     def add_container(self, container):
         self._containers.append(container)
 
+    def clear_containers(self):
+        self._containers = []
+
+    def is_asleep(self):
+        return False
+
+    def wake(self):
+        """only dynamic objects can sleep"""
+        pass
+
     def on_floor(self, boool):
         self._on_floor = boool
     
     def get_center(self):
-        self._center = {'x': self._x + self._half_size['x'], 'y': self._y + self._half_size['y']}
-        return self._center
+        return {'x': self._x + self._hx, 'y': self._y + self._hy}
 
     def get_half_size(self):
         return self._half_size
 
+    def get_box(self):
+        """returns center and half size as (cx, cy, hx, hy)"""
+        return self._x + self._hx, self._y + self._hy, self._hx, self._hy
+
+    def get_bounds(self):
+        """returns (left, top, right, bottom) edges"""
+        return self._x, self._y, self._x + 2*self._hx, self._y + 2*self._hy
+
     def get_coords(self):
         return self._x, self._y
 
-    def set_coords(self, coords):
+    def set_coords(self, coords, index=True):
+        """without 'index' containers keep the old coords till the next reindex"""
         self._x, self._y = coords
-        self._center = {'x': self._x + self._half_size['x'], 'y': self._y + self._half_size['y']}
+        if index: self.reindex()
+
+    def reindex(self):
+        """lets containers which keep positions know about new coords"""
+        for container in self._containers:
+            container.move(self)
 
     def set_image(self, image):
         self._image = image
@@ -86,344 +909,979 @@ class Object():
     def check_danger(self):
         return self._danger
 
+    def get_mask(self):
+        """returns collision layers of the object as a bit mask"""
+        return self._mask
+
+    def get_layers(self):
+        """returns collision layers of the object as a tuple of single bits"""
+        return self._layers
+
     def is_dead(self):
         return self._is_dead
 
+    def check_barrier(self, sprite):
+        """checks if objects overlap"""
+        return fabs((self._x + self._hx) - (sprite._x + sprite._hx)) < self._hx + sprite._hx\
+           and fabs((self._y + self._hy) - (sprite._y + sprite._hy)) < self._hy + sprite._hy
+
+    def check_column(self, sprite):
+        """checks if objects overlap along x axis"""
+        return fabs((self._x + self._hx) - (sprite._x + sprite._hx)) < self._hx + sprite._hx
+
+    def check_apart(self, sprite):
+        """checks if there is a gap between objects along y axis"""
+        return fabs((self._y + self._hy) - (sprite._y + sprite._hy)) > self._hy + sprite._hy
+
+    def gap_to(self, sprite, dx, dy):
+        """
+            returns how far object can go by (dx, dy) along one axis till it touches sprite,
+            0 if they overlap already and None if sprite isn't on the way,
+            objects which touch or overlap less than EPSILON only touch
+        """
+        if dx:
+            apart = fabs((self._y + self._hy) - (sprite._y + sprite._hy)) >= self._hy + sprite._hy - self.EPSILON
+            ahead, size = (sprite._x + sprite._hx) - (self._x + self._hx), sprite._hx + self._hx
+        else:
+            apart = fabs((self._x + self._hx) - (sprite._x + sprite._hx)) >= self._hx + sprite._hx - self.EPSILON
+            ahead, size = (sprite._y + sprite._hy) - (self._y + self._hy), sprite._hy + self._hy
+
+        if (dx or dy) < 0: ahead = -ahead
+
+        if apart or ahead <= self.EPSILON - size:
+            return None
+
+        return max(ahead - size, 0)
+
     def update(self):
         pass
 
 class Static(Object):
     """This is a construction that describes a static object"""
+    __slots__ = ()
+
     def __init__(self, size, coords, image, danger):
         super(Static, self).__init__(size, coords, image, danger)
 
 
 class Dynamic(Object):
-    """This is a constuction that describes a dynamic object"""
+    """
+       This is a constuction that describes a dynamic object,
+       sides where it can move are kept as bits of '_moves',
+       with '_SLEEPY' it stops updating after a frame which changed neither its place nor its moves and speed,
+       as such frame would repeat forever, objects which move near it, rotations and go() wake it up
+    """
+    __slots__ = ('_prev_x', '_prev_y', '_moves', '_ground', '_gravity',
+                 '_YSPEED', '_xspeed', '_yspeed', '_on_portal', '_asleep')
+    _STATE = Object._STATE + ('_prev_x', '_prev_y', '_moves', '_ground', '_yspeed', '_on_portal', '_asleep')
+    _LEFT, _RIGHT, _DOWN, _UP = 1, 2, 4, 8
+    _SIDES = {'left': _LEFT, 'right': _RIGHT, 'down': _DOWN, 'up': _UP}
+    _LAYER = Object.SOLID | Object.DYNAMIC
+    _SLEEPY = False
+
     def __init__(self, xspeed, yspeed, size, coords, image, danger):
         super(Dynamic, self).__init__(size, coords, image, danger)
         self._prev_x = self._x 
         self._prev_y = self._y 
-        self._can_be = {'left': False, 'right': False, 'down':False, 'up':False}
-        self._ground = self._center['y']
+        self._moves = 0
+        self._ground = self._y + self._hy
         self._gravity = 0.4
         self._YSPEED = yspeed
         self._xspeed = xspeed
         self._yspeed = yspeed
         self._on_portal = False
+        self._asleep = False
+
+    def is_asleep(self):
+        return self._asleep
+
+    def wake(self):
+        self._asleep = False
 
     def go(self, side, boool):
-        self._can_be[side] = boool
+        self._asleep = False
+
+        if boool:
+            self._moves |= self._SIDES[side]
+
+            # standing bodies have full speed anyway, but not on the frame they land from a jump
+            if side == 'up': self._yspeed = self._YSPEED
+        else:
+            self._moves &= ~self._SIDES[side]
+
+    def can_be(self, side):
+        return bool(self._moves & self._SIDES[side])
+
+    def get_xspeed(self):
+        return self._xspeed
+
+    def on_ground(self):
+        return self._y + self._hy == self._ground
 
     def die(self):
         for container in self._containers:
             container.remove(self)
             
-    def check_barrier(self, sprite):
-        if fabs(self.get_center()['x'] - sprite.get_center()['x']) < (self.get_half_size()['x'] + sprite.get_half_size()['x'])\
-        and fabs(self.get_center()['y'] - sprite.get_center()['y']) < (self.get_half_size()['y'] + sprite.get_half_size()['y']):
-            return True
-        else: 
-            return False
-
     def on_portal(self):
         """
             checks the background object, and if it's a portal, 
             it moves the dynamic object onto another portal
         """
-        for sprite in all_sprites.get():
-            if sprite == self: continue
-            elif sprite.__class__ == Portal:
-                if self.check_barrier(sprite):
-                    if not self._on_portal:
-                        self._on_portal = True
-                        self.set_coords(sprite.get_twin_coords())
+        for sprite in physics.portals(self):
+            if self.check_barrier(sprite):
+                if not self._on_portal:
+                    self._on_portal = True
+                    self.set_coords(sprite.get_twin_coords())
 
-                elif fabs(self.get_center()['x'] - sprite.get_center()['x']) < (self.get_half_size()['x'] + sprite.get_half_size()['x'])\
-                and fabs(self.get_center()['y'] - sprite.get_center()['y']) > (self.get_half_size()['y'] + sprite.get_half_size()['y']):
-                    self._on_portal = False
+            elif self.check_apart(sprite):
+                self._on_portal = False
 
     def in_danger(self):
         """
             checks the background object, and if it is danger, 
             it kills dynamic object
         """
-        for sprite in all_sprites.get():
-            if sprite == self: continue
-            if self.check_barrier(sprite) and sprite.check_danger():
-                self._is_dead = True
-                self.die()
+        for sprite in physics.dangers(self):
+            self._is_dead = True
+            self.die()
 
     def update(self):
+        if self._asleep: return
+
         self._prev_y = self._y
         self._prev_x = self._x
+        moves, yspeed = self._moves, self._yspeed
 
-        if self._can_be['right'] and not self._can_be['up'] :
-            self._x += self._xspeed
-
-            for sprite in all_without_bg:
-                if sprite == self: continue
-                if self.check_barrier(sprite): 
-                    self._x = self._prev_x
-                    break
+        if self._moves & self._RIGHT and not self._moves & self._UP:
+            self._x += physics.sweep(self, self._xspeed, 0)
 
-        if self._can_be['left'] and not self._can_be['up'] :
-            self._x -= self._xspeed
+        if self._moves & self._LEFT and not self._moves & self._UP:
+            self._x += physics.sweep(self, -self._xspeed, 0)
 
-            for sprite in all_without_bg:
-                if sprite == self: continue
-                if self.check_barrier(sprite): 
-                    self._x = self._prev_x
-                    break
-
-        if self._can_be['up']:  
-            self._y -= self._yspeed
+        if self._moves & self._UP:
+            dy = -self._yspeed
             self._yspeed -= self._gravity
+            moved = physics.sweep(self, 0, dy)
+            self._y += moved
 
-            for sprite in all_without_bg:
-                if sprite == self: continue
-                if self.check_barrier(sprite): 
-                    self._can_be['up'] = False
-                    self._yspeed = 0
-                    self._y = self._prev_y
-                    break
+            if moved != dy:
+                self._moves &= ~self._UP
+                self._yspeed = 0
 
-            if self._can_be['left']:
-                self._x -= self._xspeed//1.5
+            if self._moves & self._LEFT:
+                dx = -(self._xspeed//1.5)
+                moved = physics.sweep(self, dx, 0)
+                self._x += moved
 
-                for sprite in all_without_bg:
-                    if sprite == self: continue
-                    if self.check_barrier(sprite): 
-                        self._can_be['left'] = False
-                        self._x = self._prev_x
+                if moved != dx:
+                    self._moves &= ~self._LEFT
 
-            elif self._can_be['right']:
-                self._x += self._xspeed//1.5
+            elif self._moves & self._RIGHT:
+                dx = self._xspeed//1.5
+                moved = physics.sweep(self, dx, 0)
+                self._x += moved
 
-                for sprite in all_without_bg:
-                    if sprite == self: continue
-                    if self.check_barrier(sprite): 
-                        self._can_be['right'] = False
-                        self._x = self._prev_x
-            
-        elif self._can_be['down']:
-            self._y += self._yspeed
+                if moved != dx:
+                    self._moves &= ~self._RIGHT
+
+        elif self._moves & self._DOWN:
+            dy = self._yspeed
             self._yspeed += self._gravity
+            moved = physics.sweep(self, 0, dy)
+            self._y += moved
 
-            for sprite in all_without_bg:
-                if sprite == self:continue
-                if self.check_barrier(sprite): 
-                    self._on_floor = True
-                    self._can_be['down'] = False
-                    self._y = self._prev_y
-                    self._ground = self.get_center()['y']
-                    break
+            if moved != dy:
+                self._on_floor = True
+                self._moves &= ~self._DOWN
+                self._ground = self._y + self._hy
 
-        if not self._can_be['down'] and not self._can_be['up']:
-            for sprite in all_without_bg:
-                if sprite == self:continue
-                if fabs(self.get_center()['y'] - sprite.get_center()['y']) > (self.get_half_size()['y'] + sprite.get_half_size()['y'])\
-                and fabs(self.get_center()['x'] - sprite.get_center()['x']) < (self.get_half_size()['x']+ sprite.get_half_size()['x']):
-                    self._yspeed = self._YSPEED
-                    self._can_be['down'] = True
+        if not self._moves & (self._DOWN | self._UP) and physics.floats(self):
+            self._yspeed = self._YSPEED
+            self._moves |= self._DOWN
 
         if self._yspeed > self._YSPEED: self._yspeed = self._YSPEED
 
-        self.get_center()
+        # containers already know the place of a body which stood still, portals reindex by themselves
+        if self._x != self._prev_x or self._y != self._prev_y: self.reindex()
         self.on_portal()
         self.in_danger()
 
+        if self._x != self._prev_x or self._y != self._prev_y:
+            # one box over the old and the new place, it covers the whole way however fast the body is
+            physics.wake_near(min(self._x, self._prev_x), min(self._y, self._prev_y),
+                              max(self._x, self._prev_x) + 2*self._hx, max(self._y, self._prev_y) + 2*self._hy)
+
+        elif self._SLEEPY and self._moves == moves and self._yspeed == yspeed\
+        and not moves & (self._LEFT | self._RIGHT | self._UP):
+            self._asleep = True
+
 
 class Skull(Static):
+    __slots__ = ()
+
     def __init__(self, size, coords, image, danger=True):
         super(Skull, self).__init__(size, coords, image, danger)
 
 
 class Block(Static):
+    __slots__ = ()
+    _LAYER = Object.SOLID
+
     def __init__(self,size, coords, image, danger=False):
         super(Block, self).__init__(size, coords, image, danger)
                
 
 class Portal(Static):
-    def __init__(self,size, portal_id, twin_coords, coords, image, danger=False):
+    """sends objects to the place of its twin, see Portals.pair"""
+    __slots__ = ('_twin',)
+    _LAYER = Object.PORTAL
+
+    def __init__(self,size, coords, image, danger=False):
         super(Portal, self).__init__(size, coords, image, danger)
-        self._portal_id = portal_id
-        self._twin_coords = twin_coords 
+        self._twin = None
 
-    def get_id(self):
-        return self._portal_id
+    def get_twin(self):
+        return self._twin
+
+    def set_twin(self, twin):
+        self._twin = twin
 
     def get_twin_coords(self):
-        return self._twin_coords
+        return self._twin.get_coords()
+    
+
+class Prize(Block):
+    __slots__ = ()
+    _LAYER = Object.PRIZE
+
+    def __init__(self, size, coords, image, danger=False):
+        super(Prize, self).__init__(size, coords, image, danger)
+
+
+class Player(Dynamic):
+    __slots__ = ('_go_right_img', '_go_left_img', '_jump_img', '_fall_img', '_stay_img', '_on_prize')
+    _STATE = Dynamic._STATE + ('_on_prize',)
+
+    def __init__(self,xspeed, yspeed, size, image, coords=(0,0), danger=False):
+        super(Player, self).__init__(xspeed, yspeed, size, coords, image, danger)
+        self._go_right_img = assets.scaled('go_right.png', size)
+        self._go_left_img = assets.scaled('go_left.png', size)
+        self._jump_img = assets.scaled('jump.png', size)
+        self._fall_img = assets.scaled('fall.png', size)
+        self._stay_img = self._image
+        self._on_prize = False
+
+    def check_on_prize(self):
+        """checks the background object, and if player on door - level complete"""
+        for sprite in physics.prizes(self):
+            if fabs((self._x + self._hx) - (sprite._x + sprite._hx)) < (self._hx + sprite._hx)//2\
+            and fabs((self._y + self._hy) - (sprite._y + sprite._hy)) < self._hy + sprite._hy:
+                self._on_prize = True
+
+    def on_prize(self):
+        return self._on_prize
+
+    def update(self):
+        if self._moves & self._RIGHT and not self._moves & self._UP:
+            self._image = self._go_right_img
+
+        elif self._moves & self._LEFT and not self._moves & self._UP:
+            self._image = self._go_left_img
+
+        elif self._yspeed < 0 or not self._on_floor:
+            self._image = self._fall_img
+
+        elif self._moves & self._UP:
+            self._image = self._jump_img
+
+        else:
+            self._image = self._stay_img
+        
+        super(Player, self).update()
+        self.check_on_prize()
+
+
+class Box(Dynamic):
+    __slots__ = ()
+    _SLEEPY = True
+
+    def __init__(self,xspeed, yspeed, size,image,coords, danger=False):
+        super(Box, self).__init__(xspeed, yspeed, size, coords, image, danger)
+
+class LatestValue(object):
+    """
+       slot which keeps only the newest value with its time stamp, the writer replaces
+       one tuple by a single assignment, so readers never wait and never see a half update
+    """
+    def __init__(self, value=None):
+        self._item = value, 0.0, 0
+
+    def set(self, value, stamp=None):
+        """only one thread may write into the slot"""
+        self._item = value, time.perf_counter() if stamp is None else stamp, self._item[2] + 1
+
+    def get(self):
+        """returns (value, stamp, number of the update)"""
+        return self._item
+
+
+class ImageFolder(object):
+    """frame source which reads images of a directory in name order, it works like cv2.VideoCapture"""
+    def __init__(self, path, loop=False):
+        import_cv()
+        self._files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                             if name.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')))
+        self._loop = loop
+        self._next = 0
+
+    def read(self):
+        if self._next >= len(self._files):
+            if not self._loop or not self._files:
+                return False, None
+            self._next = 0
+
+        frame = cv2.imread(self._files[self._next])
+        self._next += 1
+        return frame is not None, frame
+
+    def release(self):
+        pass
+
+
+class BlobSource(object):
+    """
+       synthetic frame source: orange blob which moves over a noisy background, 'dim' is how much
+       the light fades in the middle of the run, get_truth() returns the center of the blob in the last read frame
+    """
+    def __init__(self, width=640, height=480, frames=300, radius=30, seed=0, dim=0.0):
+        import_cv()
+        self._width = width
+        self._height = height
+        self._frames = frames
+        self._radius = radius
+        self._dim = dim
+        self._random = np.random.default_rng(seed)
+        self._next = 0
+        self._truth = None
+
+    def read(self):
+        if self._next >= self._frames:
+            return False, None
+
+        t = self._next/self._frames
+        self._next += 1
+        x = int(self._radius + (self._width - 2*self._radius)*(0.5 + 0.5*sin(2*pi*t)))
+        y = int(self._radius + (self._height - 2*self._radius)*(0.5 + 0.5*cos(3*pi*t)))
+        frame = self._random.integers(0, 60, (self._height, self._width, 3), dtype=np.uint8)
+        light = 1 - self._dim*(0.5 - 0.5*cos(2*pi*t))
+        cv2.circle(frame, (x, y), self._radius, (0, 128*light, 255*light), -1)
+        self._truth = x, y
+        return True, frame
+
+    def get_truth(self):
+        return self._truth
+
+    def release(self):
+        pass
+
+
+def open_source(source):
+    """returns object with read() and release() for camera index, video file, directory of images or ready source"""
+    if hasattr(source, 'read'):
+        return source
+
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageFolder(source)
+
+    return import_cv().VideoCapture(source)
+
+
+class Cv(object):
+    """
+       tracks an object of the target color, frames are processed downscaled by 'scale'
+       and only inside 'roi' (x, y, w, h) if it is given, 'source' is anything open_source takes,
+       with 'track' only a window around the last found blob is searched,
+       with 'adapt' HSV bounds follow the colors of the blob
+    """
+    _TOLERANCE = np.array([6, 40, 60])  # how far outside the bounds pixels of the blob are still taken into account
+    _PADDING = np.array([3, 25, 35])  # bounds are kept this much wider than the colors of the blob
+    _DRIFT = np.array([10, 80, 100])  # how far the bounds may leave the initial ones
+    _HSV_MAX = np.array([179, 255, 255])
+
+    def __init__(self, scale=0.5, roi=None, source=0, track=True, adapt=True, adapt_rate=0.1):
+        self._hmin = 0
+        self._smin = 85
+        self._vmin = 141
+        self._hmax = 15
+        self._smax = 255
+        self._vmax = 255
+        self._scale = scale
+        self._roi = roi
+        self._source = source
+        self._track = track
+        self._adapt = adapt
+        self._adapt_rate = adapt_rate
+        self._initial = self.get_bounds()
+        self._window = None
+        self._margin = 1
+        self._running = False
+        self._frames = LatestValue()
+        self._new_frame = Event()
+        self._aim = LatestValue((False, 0, 0))
+
+    def show_control_panel(self):
+        """function realize sliders for setting HSV"""
+        from tkinter import Tk, Scale, HORIZONTAL
+
+        root=Tk()
+        s1 = Scale(root,length=600,label='Hmin', from_=0, to=360,orient=HORIZONTAL, command=lambda v: setattr(self, '_hmin', int(v)))
+        s1.set(self._hmin)
+        s4 = Scale(root,length=600,label='Hmax', from_=0, to=360,orient=HORIZONTAL, command=lambda v: setattr(self, '_hmax', int(v)))
+        s4.set(self._hmax)
+        s2 = Scale(root,length=600,label='Smin', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_smin', int(v)))
+        s2.set(self._smin)
+        s5 = Scale(root,length=600,label='Smax', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_smax', int(v)))
+        s5.set(self._smax)
+        s3 = Scale(root,length=600,label='Vmin', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_vmin', int(v)))
+        s3.set(self._vmin)
+        s6 = Scale(root,length=600,label='Vmax', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_vmax', int(v)))
+        s6.set(self._vmax)
+        s1.pack()
+        s2.pack()
+        s3.pack()
+        s4.pack()
+        s5.pack()
+        s6.pack()
+        root.mainloop()
+
+    def capture(self):
+        """capture thread: reads the source as fast as it can and keeps only the newest frame"""
+        cap = open_source(self._source)
+
+        while self._running and not quit_cv:
+            ok, frame = cap.read()
+            if not ok: break
+
+            self._frames.set(frame)
+            self._new_frame.set()
+
+        cap.release()
+        self._running = False
+        self._new_frame.set()
+
+    def get_bounds(self):
+        """returns (lower, upper) HSV bounds of the target color"""
+        return (np.array([self._hmin, self._smin, self._vmin], dtype=float),
+                np.array([self._hmax, self._smax, self._vmax], dtype=float))
+
+    def set_bounds(self, lower, upper):
+        self._hmin, self._smin, self._vmin = lower
+        self._hmax, self._smax, self._vmax = upper
+
+    def get_window(self):
+        """returns (x, y, w, h) of the last found blob while tracking or None"""
+        return self._window
+
+    def _search_area(self, frame):
+        """returns (area, full area) as (x, y, w, h), area is a window around the last blob while tracking"""
+        frame_height, frame_width = frame.shape[:2]
+        full = self._roi if self._roi is not None else (0, 0, frame_width, frame_height)
+
+        if self._window is None:
+            return full, full
+
+        left, top, width, height = full
+        x, y, w, h = self._window
+        pad = int(self._margin*max(w, h)) + 8
+        l, t = max(left, x - pad), max(top, y - pad)
+        r, b = min(left + width, x + w + pad), min(top + height, y + h + pad)
+        return (l, t, r - l, b - t), full
+
+    def _adapt_bounds(self, hsv, mask):
+        """moves HSV bounds towards the colors of the blob: 5th and 95th percentiles of its histograms"""
+        lower, upper = self.get_bounds()
+        low, high = np.empty(3), np.empty(3)
+
+        for channel in range(3):
+            hist = cv2.calcHist([hsv], [channel], mask, [256], [0, 256]).cumsum()
+
+            if hist[-1] < 16:
+                return
+
+            low[channel] = np.searchsorted(hist, 0.05*hist[-1])
+            high[channel] = np.searchsorted(hist, 0.95*hist[-1])
+
+        low -= self._PADDING
+        high += self._PADDING
+        lower += self._adapt_rate*(low - lower)
+        upper += self._adapt_rate*(high - upper)
+        initial_lower, initial_upper = self._initial
+        lower = np.clip(lower, np.maximum(initial_lower - self._DRIFT, 0), initial_lower + self._DRIFT)
+        upper = np.clip(upper, initial_upper - self._DRIFT, np.minimum(initial_upper + self._DRIFT, self._HSV_MAX))
+        self.set_bounds(lower, np.maximum(upper, lower))
+
+    def find_aim(self, frame, timings=None):
+        """
+            returns (x, y, w, h) of the biggest blob of the target color in frame coords or None,
+            while tracking the search window is doubled every time the blob is lost until it is the whole frame,
+            'timings' dict gets duration of every stage in seconds
+        """
+        import_cv()
+        area, full = self._search_area(frame)
+        left, top, width, height = area
+        start = time.perf_counter()
+        frame = frame[top:top+height, left:left+width]
+
+        small = cv2.resize(frame, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+        start = self._lap(timings, 'resize', start)
+        blur_size = max(3, int(15*self._scale)) | 1
+        frame_blur = cv2.GaussianBlur(small, (blur_size, blur_size), 0)
+        start = self._lap(timings, 'blur', start)
+        hsv = cv2.cvtColor(frame_blur, cv2.COLOR_BGR2HSV)
+        start = self._lap(timings, 'hsv', start)
+        lower_color, upper_color = self.get_bounds()
+        mask = cv2.inRange(hsv, lower_color, upper_color)
+        start = self._lap(timings, 'mask', start)
+        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        start = self._lap(timings, 'contour', start)
+
+        if not len(contours):
+            if self._window is not None:
+                if area == full: self._window = None
+                else: self._margin *= 2
+
+            return None
+
+        x, y, w, h = cv2.boundingRect(max(contours, key = cv2.contourArea))
+
+        if self._adapt:
+            blob = hsv[y:y+h, x:x+w]
+            near = cv2.inRange(blob, lower_color - self._TOLERANCE, upper_color + self._TOLERANCE)
+            self._adapt_bounds(blob, near)
+            self._lap(timings, 'adapt', start)
+
+        rect = (left + int(x/self._scale), top + int(y/self._scale),
+                int(w/self._scale), int(h/self._scale))
+
+        if self._track:
+            self._window = rect
+            self._margin = 1
+
+        return rect
+
+    def _lap(self, timings, stage, start):
+        now = time.perf_counter()
+        if timings is not None: timings[stage] = now - start
+        return now
+
+    def get_aim(self):
+        """returns ((found, aim_x, aim_y), time stamp of the camera frame, number of the update)"""
+        return self._aim.get()
+
+    def is_running(self):
+        return self._running
+
+    def stop(self):
+        self._running = False
+
+    def show_video_capture(self, DISPLAY_WIDTH, DISPLAY_HEIGHT, show=True):
+        """
+            processing stage: takes the newest frame from the capture thread, finds the aim
+            and publishes it at once, frames which came while it was busy are dropped
+        """
+        import_cv()
+        self._running = True
+        Thread(target=self.capture, daemon=True).start()
+        processed = 0
+
+        while self._running and not quit_cv:
+            self._new_frame.wait(0.1)
+            self._new_frame.clear()
+            frame, stamp, number = self._frames.get()
+
+            if frame is None or number == processed:
+                continue
+
+            processed = number
+            rect = self.find_aim(frame)
+
+            if rect is not None:
+                x, y, w, h = rect
+                self._aim.set((True, DISPLAY_WIDTH - x + w//2, y + h//2), stamp)
+            else:
+                self._aim.set((False, 0, 0), stamp)
+
+            if show:
+                if rect is not None:
+                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 5)
+                    cv2.rectangle(frame, (x+w//2, y+h//2), (x+w//2, y+h//2), (255, 0, 0), 10)
+
+                cv2.imshow('frame',frame)
+
+                k = cv2.waitKey(1) & 0xFF
+                if k == 27:
+                    break
+
+        self._running = False
+
+        if show: cv2.destroyAllWindows()
+
+
+class Renderer(object):
+    """
+       draws static objects once into a cached background,
+       then each frame redraws only the places where dynamic objects were or are,
+       objects are shifted by the offset of the camera and drawn only inside 'clip' (x, y, w, h)
+    """
+    def __init__(self, screen, color, clip=None):
+        self._screen = screen
+        self._color = color
+        self._clip = clip
+        self._background = None
+        self._offset = None
+        self._rects = []
+
+    def invalidate(self):
+        """background will be composed again on the next frame, e.g. after a rotation"""
+        self._background = None
+
+    def compose(self, static_groups, static_overlays=(), offset=(0, 0)):
+        self._screen.fill(self._color)
+        self._screen.set_clip(self._clip)
+
+        for group in static_groups:
+            self._screen.blits(Group.blit_list(group, offset), doreturn=False)
+
+        self._screen.set_clip(None)
+
+        for image, coords in static_overlays:
+            self._screen.blit(image, coords)
+
+        self._background = self._screen.copy()
+        self._offset = offset
+
+    def draw(self, static_groups, dynamic_groups, overlays=(), static_overlays=(), offset=(0, 0)):
+        """
+            groups are collections of objects, 'overlays' and 'static_overlays' are pairs (image, coords)
+            which are drawn above dynamic objects and into the background respectively,
+            the background is composed again when the camera 'offset' changes
+        """
+        full = self._background is None or offset != self._offset
+
+        if full:
+            self.compose(static_groups, static_overlays, offset)
+        else:
+            self._screen.blits([(self._background, rect, rect) for rect in self._rects], doreturn=False)
+
+        profiler.lap('static')
+        dirty = self._rects
+        self._rects = []
+        self._screen.set_clip(self._clip)
+
+        for group in dynamic_groups:
+            self._rects.extend(self._screen.blits(Group.blit_list(group, offset)))
+
+        self._screen.set_clip(None)
+
+        for image, coords in overlays:
+            self._rects.append(self._screen.blit(image, coords))
+
+        profiler.lap('dynamic')
+
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update(dirty + self._rects)
+
+        profiler.lap('display')
+
+
+class Camera(object):
+    """
+       part of the board which is seen in the window, it keeps the followed object
+       in the middle and doesn't look outside the board
+    """
+    def __init__(self, width, height, board_size):
+        self._width = width
+        self._height = height
+        self._board_size = board_size
+        self._x = self._y = 0
+
+    def follow(self, sprite):
+        cx, cy, _, _ = sprite.get_box()
+        self._x = int(min(max(cx - self._width//2, 0), max(self._board_size - self._width, 0)))
+        self._y = int(min(max(cy - self._height//2, 0), max(self._board_size - self._height, 0)))
+
+    def get_offset(self):
+        return self._x, self._y
+
+    def get_view(self, margin=0):
+        """returns (left, top, right, bottom) of the seen part of the board widened by 'margin'"""
+        return self._x - margin, self._y - margin, self._x + self._width + margin, self._y + self._height + margin
+
+    def sees_all(self):
+        return self._board_size <= self._width and self._board_size <= self._height
+
+
+class Rotation(object):
+    """
+       time based tween which moves objects to their cells after a rotation of the board,
+       it eases in and out during 'duration' seconds and can be turned back,
+       'starts' and 'targets' are (n, 2) arrays of coords of 'sprites',
+       'follow' is the object which the camera follows
+    """
+    def __init__(self, side, sprites, starts, targets, duration, follow=None):
+        self._side = side
+        self._sprites = sprites
+        self._starts = starts
+        self._targets = targets
+        self._duration = duration
+        self._elapsed = 0
+        self._follow = sprites.index(follow) if follow in sprites else None
+        self._moved = sprites
+        self._cancelled = False
+
+    def get_side(self):
+        return self._side
+
+    def is_cancelled(self):
+        """checks if objects are going back to where they were"""
+        return self._cancelled
+
+    def cancel(self):
+        """objects go back to where they were, from the place they have reached, cancel of a cancel turns them again"""
+        self._starts, self._targets = self._targets, self._starts
+        self._elapsed = self._duration - self._elapsed
+        self._side = {'left': 'right', 'right': 'left'}[self._side]
+        self._cancelled = not self._cancelled
+
+    def advance(self, dt, view=None):
+        """
+            moves objects by 'dt' seconds of the tween, returns True when it is over,
+            'view' is called after the followed object has moved and returns (left, top, right, bottom),
+            objects outside of it aren't moved till the end, as nobody sees them,
+            physics stands still meanwhile, so containers learn new coords only at the end
+        """
+        self._elapsed += dt
+        u = min(1, self._elapsed/self._duration) if self._duration > 0 else 1
+
+        if u >= 1:
+            self._moved = self._sprites
+
+            for obj, xy in zip(self._sprites, self._targets.tolist()):
+                obj.set_coords(xy)
+
+            return True
+
+        k = u*u*(3 - 2*u)
+        coords = self._starts + (self._targets - self._starts)*k
+
+        self._moved = self._sprites
+
+        if view is not None:
+            if self._follow is not None:
+                self._sprites[self._follow].set_coords(coords[self._follow].tolist(), False)
+
+            left, top, right, bottom = view()
+            x, y = coords[:, 0], coords[:, 1]
+            rows = np.flatnonzero((x >= left) & (x < right) & (y >= top) & (y < bottom))
+            self._moved, coords = [self._sprites[row] for row in rows.tolist()], coords[rows]
+
+        for obj, xy in zip(self._moved, coords.tolist()):
+            obj.set_coords(xy, False)
+
+        return False
+
+    def get_moved(self):
+        """returns objects which were moved by the last advance"""
+        return self._moved
+
+
+class Input(object):
+    """
+       turns keyboard, mouse and camera into one queue of (time stamp, action) with actions as in Level.apply,
+       only changes of the input state get into it, 'bindings' map keys to names of CONTROLS,
+       a zone of the camera aim has to hold for 'debounce' seconds before it is taken
+    """
+    BINDINGS = {pygame.K_a: 'left', pygame.K_d: 'right', pygame.K_w: 'up',
+                pygame.K_LEFT: 'rotate_left', pygame.K_z: 'rotate_left',
+                pygame.K_RIGHT: 'rotate_right', pygame.K_x: 'rotate_right',
+                pygame.K_BACKSPACE: 'undo', pygame.K_u: 'undo',
+                pygame.K_F3: 'hud', pygame.K_F4: 'profile'}
+    # actions of a control when its key is pressed and released
+    CONTROLS = {'left': ((('go', 'left', True),), (('go', 'left', False),)),
+                'right': ((('go', 'right', True),), (('go', 'right', False),)),
+                'up': ((('go', 'up', True),), ()),
+                'rotate_left': ((), (('rotate', 'left'),)),
+                'rotate_right': ((), (('rotate', 'right'),)),
+                'undo': ((), (('undo',),)),
+                'hud': ((), (('hud',),)),
+                'profile': ((), (('profile',),))}
+    # actions when the camera aim comes into a zone of the window, they are sent again on every camera update
+    # while the aim stays there, so the zone holds after a restart, an undo or a jump into a wall,
+    # Level.apply drops the ones which change nothing, e.g. jumps in the air
+    ZONES = {'left': (('go', 'right', False), ('go', 'left', True)),
+             'right': (('go', 'left', False), ('go', 'right', True)),
+             'jump_left': (('go', 'right', False), ('go', 'up', True), ('go', 'left', True)),
+             'jump_right': (('go', 'left', False), ('go', 'up', True), ('go', 'right', True))}
+
+    def __init__(self, width, height, bindings=None, debounce=0.05):
+        self._width = width
+        self._height = height
+        self._bindings = dict(self.BINDINGS if bindings is None else bindings)
+        self._debounce = debounce
+        self._queue = deque()
+        self._buttons = []
+        self._pressed = set()
+        self._zone = None
+        self._candidate = None, 0.0
+        self._aim_number = 0
+        self._latencies = deque(maxlen=256)
+
+    def bind(self, key, control):
+        self._bindings[key] = control
+
+    def add_button(self, button, action):
+        """'action' is queued when the mouse is released over 'button'"""
+        self._buttons.append((button, action))
+
+    def push(self, action, stamp=None):
+        self._queue.append((time.perf_counter() if stamp is None else stamp, action))
+
+    def poll(self):
+        """moves pygame events into the queue, held keys which are pressed again are skipped"""
+        stamp = time.perf_counter()
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.push(('quit',), stamp)
+
+            elif event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
+                control = self._bindings.get(event.key)
+                if control is None: continue
+
+                pressed = event.type == pygame.KEYDOWN
+
+                if pressed == (control in self._pressed):
+                    continue
+
+                if pressed: self._pressed.add(control)
+                else: self._pressed.discard(control)
+
+                for action in self.CONTROLS[control][not pressed]:
+                    self.push(action, stamp)
+
+            elif event.type == pygame.MOUSEBUTTONUP:
+                for button, action in self._buttons:
+                    if button.is_aim(event.pos):
+                        self.push(action, stamp)
 
-    def set_twin_coords(self, twin_coords):
-        self._twin_coords = twin_coords
-    
+    def track_aim(self, aim, stamp, number):
+        """takes an update of the camera aim ((found, x, y), stamp, number), the same update is skipped"""
+        if number == self._aim_number:
+            return
 
-class Prize(Block):
-    def __init__(self, size, coords, image, danger=False):
-        super(Prize, self).__init__(size, coords, image, danger)
+        self._aim_number = number
+        found, x, y = aim
+        zone = self.zone(x, y) if found else None
 
+        if zone is None or zone == self._zone:
+            self._candidate = None, 0.0
 
-class Player(Dynamic):
-    def __init__(self,xspeed, yspeed, size, image, coords=(0,0), danger=False):
-        super(Player, self).__init__(xspeed, yspeed, size, coords, image, danger)
-        self._go_right_img = pygame.image.load('go_right.png')
-        self._go_right_img= pygame.transform.scale(self._go_right_img, size)
-        self._go_left_img = pygame.image.load('go_left.png')
-        self._go_left_img = pygame.transform.scale(self._go_left_img, size)
-        self._jump_img = pygame.image.load('jump.png')
-        self._jump_img = pygame.transform.scale(self._jump_img, size)
-        self._fall_img = pygame.image.load('fall.png')
-        self._fall_img = pygame.transform.scale(self._fall_img, size)
-        self._stay_img = self._image
-        self._on_prize = False
+            for action in self.ZONES.get(zone, ()):
+                self.push(action, stamp)
 
-    def check_on_prize(self):
-        """checks the background object, and if player on door - level complete"""
-        for sprite in all_sprites.get():
-            if sprite == self: continue
-            if sprite.__class__ == Prize\
-            and fabs(self.get_center()['x'] - sprite.get_center()['x']) < (self.get_half_size()['x'] + sprite.get_half_size()['x'])//2\
-            and fabs(self.get_center()['y'] - sprite.get_center()['y']) < (self.get_half_size()['y'] + sprite.get_half_size()['y']):
-                self._on_prize = True
+            return
 
-    def on_prize(self):
-        return self._on_prize
+        if self._candidate[0] != zone:
+            self._candidate = zone, stamp
 
-    def update(self):
-        if self._can_be['right'] and not self._can_be['up']:
-            self._image = self._go_right_img
+        if stamp - self._candidate[1] >= self._debounce:
+            self._zone = zone
+            self._candidate = None, 0.0
 
-        elif self._can_be['left'] and not self._can_be['up']:
-            self._image = self._go_left_img
+            for action in self.ZONES[zone]:
+                self.push(action, stamp)
 
-        elif self._yspeed < 0 or not self._on_floor:
-            self._image = self._fall_img
+    def zone(self, x, y):
+        """returns zone of the window which aim (x, y) is in or None"""
+        if y > self._height//2:
+            if x > self._width//2: return 'right'
+            if x < self._width//2: return 'left'
 
-        elif self._can_be['up'] :
-            self._image = self._jump_img
+        elif y < self._height//3:
+            if x < self._width//2: return 'jump_left'
+            if x > self._width//2: return 'jump_right'
 
-        else:
-            self._image = self._stay_img
-        
-        super(Player, self).update()
-        self.check_on_prize()
+        return None
 
+    def take(self):
+        """yields queued actions in order, time from their sources till now is kept as latency"""
+        while self._queue:
+            stamp, action = self._queue.popleft()
+            self._latencies.append(time.perf_counter() - stamp)
+            yield action
 
-class Box(Dynamic):
-    def __init__(self,xspeed, yspeed, size,image,coords, danger=False):
-        super(Box, self).__init__(xspeed, yspeed, size, coords, image, danger)
+    def get_latencies(self):
+        """returns latencies of the last taken actions in seconds"""
+        return self._latencies
 
-class Cv(object):
-    def __init__(self):
-        self._hmin = 0
-        self._smin = 85
-        self._vmin = 141
-        self._hmax = 15
-        self._smax = 255
-        self._vmax = 255
 
-    def show_control_panel(self):
-        """function realize sliders for setting HSV"""
-        root=Tk()
-        s1 = Scale(root,length=600,label='Hmin', from_=0, to=360,orient=HORIZONTAL, command=lambda v: setattr(self, '_hmin', int(v)))
-        s1.set(self._hmin)
-        s4 = Scale(root,length=600,label='Hmax', from_=0, to=360,orient=HORIZONTAL, command=lambda v: setattr(self, '_hmax', int(v)))
-        s4.set(self._hmax)
-        s2 = Scale(root,length=600,label='Smin', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_smin', int(v)))
-        s2.set(self._smin)
-        s5 = Scale(root,length=600,label='Smax', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_smax', int(v)))
-        s5.set(self._smax)
-        s3 = Scale(root,length=600,label='Vmin', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_vmin', int(v)))
-        s3.set(self._vmin)
-        s6 = Scale(root,length=600,label='Vmax', from_=0, to=255, orient=HORIZONTAL, command=lambda v: setattr(self, '_vmax', int(v)))
-        s6.set(self._vmax)
-        s1.pack()
-        s2.pack()
-        s3.pack()
-        s4.pack()
-        s5.pack()
-        s6.pack()
-        root.mainloop()
+class Recorder(object):
+    """
+       log of a played level in the format of Simulation: actions with numbers of their frames
+       and duration of every frame in milliseconds, so the run can be replayed exactly,
+       it is saved to 'path' when the level is over or the game is closed
+    """
+    RECORDED = ('go', 'rotate', 'undo')
 
-    def show_video_capture(self,DISPLAY_WIDTH, DISPLAY_HEIGHT):
-        global aim_x, aim_y, visio_control, quit_cv
-        cap = cv2.VideoCapture(0)
+    def __init__(self, path, lvl_num, layout=None):
+        self._path = path
+        self._lvl_num = lvl_num
+        self._layout = layout
+        self._script = []
+        self._steps = []
 
-        while True:
-            _, frame = cap.read()
-            frame_blur = cv2.GaussianBlur(frame, (15,15), 0)
-            hsv = cv2.cvtColor(frame_blur, cv2.COLOR_BGR2HSV)
-            lower_color = np.array([self._hmin,self._smin,self._vmin])
-            upper_color = np.array([self._hmax,self._smax,self._vmax])
-            mask = cv2.inRange(hsv, lower_color, upper_color)
-            res = cv2.bitwise_and(frame, frame, mask=mask)
-            contours, image = cv2.findContours(mask.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-
-            if len(contours):
-                visio_control = True
-                cnt = max(contours, key = cv2.contourArea)
-                x, y, w, h = cv2.boundingRect(cnt)
-
-                if x > DISPLAY_WIDTH//2:
-                    aim_x = DISPLAY_WIDTH//2 - (x-DISPLAY_WIDTH//2) + w//2
-                else:
-                    aim_x = DISPLAY_WIDTH//2 + (DISPLAY_WIDTH//2-x) + w//2
+    def action(self, action):
+        if action[0] in self.RECORDED:
+            self._script.append([len(self._steps), list(action)])
 
-                aim_y = y+h//2
-                get_center = (x+w//2, y+h//2)
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 5)
-                cv2.rectangle(frame, get_center, get_center, (255, 0, 0), 10)
-                cv2.imshow('frame',frame)
-                # cv2.imshow('mask',mask)
-                # cv2.imshow('res',res)                
+    def step(self, ms):
+        self._steps.append(ms)
 
-            else:
-                visio_control = False
-                cv2.imshow('frame',frame)
-                # cv2.imshow('mask',mask)
-                # cv2.imshow('res',res)
+    def save(self, result, checksum):
+        """'result' is how the run ended, 'checksum' of the level state lets replays check themselves"""
+        replay = {'level': self._lvl_num, 'respawn': True, 'max_frames': len(self._steps),
+                  'result': result, 'checksum': checksum, 'script': self._script, 'steps': self._steps}
 
-            k = cv2.waitKey(5) & 0xFF
-            if k == 27:
-                break
+        if self._layout is not None:
+            replay['layout'] = self._layout
 
-            if quit_cv:
-                break
-        cv2.destroyAllWindows()
-        cap.release()
+        with open(self._path, 'w') as f:
+            json.dump(replay, f)
 
 
 class Game(object):
-    """main object which contain all functions for game interaction"""
-    def __init__(self):
+    """
+       main object which contain all functions for game interaction,
+       'headless' game has no window and draws nothing
+    """
+    def __init__(self, headless=False):
         self._DISPLAY_WIDTH = self._DISPLAY_HEIGHT = 700
         self._ADDITIONAL_WIDTH = 50
         self._backgroun_color = 45,58,103
         self._green = 0, 255, 0
         self._red = 255, 0, 0
         self._FPS = 60
-        pygame.init()
-        self._screen = pygame.display.set_mode((self._DISPLAY_WIDTH+self._ADDITIONAL_WIDTH, self._DISPLAY_HEIGHT))
-        pygame.display.set_caption('Run - rotate')
-        icon = pygame.image.load("icon.png")
-        icon.set_colorkey(self._backgroun_color)
-        pygame.display.set_icon(icon)
-        self._clock = pygame.time.Clock()
-        self._player_img = pygame.image.load('player.png')
-        self._block_img = pygame.image.load('block.jpg')
-        self._frame_img = pygame.image.load('frame.jpg')
-        self._box_img = pygame.image.load('box.jpg')
-        self._exit_img = pygame.image.load('exit.jpg')
-        self._portal_img = pygame.image.load('portal.jpg')
-        self._skull_img = pygame.image.load('skull.jpg')
-        self._aim_img = pygame.image.load('aim.png')
-        self._win_img = pygame.image.load('pobeda.jpg')
-        self._death_img = pygame.image.load('smert.jpg')
-        self._aim_img = pygame.transform.scale(self._aim_img, (40,40))
-        self._win_img = pygame.transform.scale(self._win_img, (self._DISPLAY_WIDTH+self._ADDITIONAL_WIDTH, self._DISPLAY_HEIGHT))
-        self._death_img = pygame.transform.scale(self._death_img, (self._DISPLAY_WIDTH+self._ADDITIONAL_WIDTH, self._DISPLAY_HEIGHT))
+        self._headless = headless
+        self._screen = self._renderer = None
+        self._clock = window.get_clock()
+
+        if not self._headless:
+            self._screen = window.open((self._DISPLAY_WIDTH+self._ADDITIONAL_WIDTH, self._DISPLAY_HEIGHT), 'Run - rotate')
+            self._renderer = Renderer(self._screen, self._backgroun_color, (0, 0, self._DISPLAY_WIDTH, self._DISPLAY_HEIGHT))
+
+        self._aim_img = assets.scaled('aim.png', (40,40))
         self._pause = Button((self._DISPLAY_WIDTH+self._ADDITIONAL_WIDTH-50, 0), 'pause.png', 'pause.png', (50, 50))
 
     def quitgame(self):
@@ -433,102 +1891,57 @@ class Game(object):
         pygame.quit()
         quit()
 
-    def smooth_movement(self, arr):
-        temp_container = {}
-
-        for i in range(len(arr)):
-            for j in range(len(arr[0])):
-                obj = arr[i][j]
-                if obj != '':
-                    obj.on_floor(False)
-                    x2, y2 = j*self._CELL_SIZE, i*self._CELL_SIZE
-                    temp_container[obj] = x2, y2
-
-        for i in range(100):
-            t = i/100
-            for obj in temp_container:
-                x0,y0 = obj.get_coords()
-                x2,y2 = temp_container[obj]
-                x1 = (1-t)*x0+t*x2
-                y1 = (1-t)*y0+t*y2
-                obj.set_coords((x1,y1))
-        
-            self._screen.fill(self._backgroun_color)
-            all_sprites.draw(self._screen)
-            self._screen.blit(self._pause.get_image(), self._pause.get_coords())
-            pygame.display.update()
+    def smooth_movement(self, side, sprites, starts, targets, follow=None):
+        """starts moving objects from 'starts' to 'targets' coords, 'follow' is followed by the camera"""
+        for obj in sprites:
+            obj.on_floor(False)
+            obj.wake()
 
-        try:
-            self._portal0.set_twin_coords(self._portal1.get_coords())
-            self._portal1.set_twin_coords(self._portal0.get_coords())
-        except: pass
+        self._rotation = Rotation(side, sprites, starts, targets, self._rotation_time, follow)
+
+        if not self._headless: self._renderer.invalidate()
+
+    def finish_movement(self):
+        self._rotation = None
+
+        if not self._headless: self._renderer.invalidate()
     
-    def rotate_grid(self,side,grid):
-        temp = [['' for j in range(self._DISPLAY_HEIGHT//self._CELL_SIZE)]\
-               for i in range(self._DISPLAY_HEIGHT//self._CELL_SIZE)]
-        k=0
-
-        if side == "right":
-            for j in range(len(grid[0])-1, -1, -1): 
-                for i in range(len(grid)):
-                    temp[i][k] = grid[j][i]
-                k+=1
-        
-        elif side == "left":
-            for j in range(len(grid[0])-1, -1, -1): 
-                for i in range(len(grid)):
-                    temp[k][i] = grid[i][j]
-                k+=1
+    def preload(self):
+        """starts decoding big images which the first frame doesn't need: the icon, win and death screens"""
+        assets.preload('icon.png', 'pobeda.jpg', 'smert.jpg')
 
-        self.smooth_movement(temp)
-        
     def show_message_of_win(self):
-        self._screen.blit(self._win_img, (0,0))
+        self._screen.blit(assets.scaled('pobeda.jpg', self._screen.get_size()), (0,0))
         pygame.display.update()
         time.sleep(2)
 
     def show_message_of_death(self):
-        self._screen.blit(self._death_img, (0,0))
+        self._screen.blit(assets.scaled('smert.jpg', self._screen.get_size()), (0,0))
         pygame.display.update()
         time.sleep(2)
 
-    def round_to_cell_size(self, coord):
-        if coord % self._CELL_SIZE >= self._CELL_SIZE//2:
-            coord += self._CELL_SIZE - coord % self._CELL_SIZE
-            return coord
-
-        else:
-            coord = coord - coord % self._CELL_SIZE
-            return coord
-
-    def place_to_grid(self, group):
-        grid = [['' for j in range(self._DISPLAY_HEIGHT//self._CELL_SIZE)]\
-                              for i in range(self._DISPLAY_HEIGHT//self._CELL_SIZE)]
-        for el in group.get():
-            x = self.round_to_cell_size(el.get_coords()[0])
-            y = self.round_to_cell_size(el.get_coords()[1])
-            el.set_coords((x,y))
-            j,i = int(x//self._CELL_SIZE), int(y//self._CELL_SIZE)
-            grid[i][j] = el
-
-        return grid
-       
-    def main(self):
-        global visio, aim_x, aim_y, visio_control, quit_cv
+    def main(self, record_dir=None):
+        """'record_dir' is where runs of levels are recorded to, they aren't recorded by default"""
+        global visio, visio_control, quit_cv
         visio_control = False
         quit_cv = False
-        aim_x = aim_y = 0
         visio = Cv()
 
+        if record_dir is not None:
+            os.makedirs(record_dir, exist_ok=True)
+
         while True:
             menu = Menu()
             menu.start()
-            lvl1 = Level(1)
-            lvl1.start()
-            lvl2 = Level(2)
-            lvl2.start()
-            lvl3 = Level(3)
-            lvl3.start()
+
+            for lvl_num in levels.numbers():
+                recorder = None
+
+                if record_dir is not None:
+                    name = 'level%d-%s.json' % (lvl_num, time.strftime('%Y%m%d-%H%M%S'))
+                    recorder = Recorder(os.path.join(record_dir, name), lvl_num)
+
+                Level(lvl_num).start(recorder=recorder)
 
 class Button(pygame.sprite.Sprite):
     def __init__(self, coords, image, image_press, size):
@@ -536,10 +1949,8 @@ class Button(pygame.sprite.Sprite):
         self._size = {'x': size[0], 'y': size[1]}
         self._x, self._y = coords
         self._rect = {'left': self._x, 'top': self._y, 'right': self._x + self._size['x'], 'bottom': self._y + self._size['y']}
-        self._image = pygame.image.load(image)
-        self._image_press = pygame.image.load(image_press)
-        self._image = pygame.transform.scale(self._image, size)
-        self._image_press = pygame.transform.scale(self._image_press, size)
+        self._image = assets.scaled(image, size)
+        self._image_press = assets.scaled(image_press, size)
         self._current_img = self._image
         self._pressed = False
 
@@ -552,6 +1963,10 @@ class Button(pygame.sprite.Sprite):
     def add_container(self, obj):
         pass
 
+    def get_layers(self):
+        """buttons don't take part in collisions"""
+        return ()
+
     def press(self, boool=False):
         self._pressed = boool
 
@@ -570,19 +1985,33 @@ class Button(pygame.sprite.Sprite):
 
 
 class Menu(Game):
-    def __init__(self):
+    """main menu, when it pauses a 'level' quitting from it closes the game the way the level does"""
+    def __init__(self, level=None):
         super(Menu, self).__init__()
+        self._level = level
         self._menu_play = Button((200+self._ADDITIONAL_WIDTH//2,110), 'menu_game.png', 'menu_game_press.png', (300,100))
         self._menu_options = Button((200+self._ADDITIONAL_WIDTH//2,310), 'menu_options.png', 'menu_options_press.png', (300,100))
         self._menu_exit = Button((200+self._ADDITIONAL_WIDTH//2,510), 'menu_exit.png', 'menu_exit_press.png', (300,100))
 
-    def start(self):
+    def quitgame(self):
+        if self._level is not None:
+            self._level.quitgame()
+
+        super(Menu, self).quitgame()
+
+    def start(self, frames=None):
+        """
+            shows the menu till a button is chosen, returns 0 for play,
+            'frames' stops it after so many frames with None (e.g. to measure startup),
+            big images are decoded in the background after the first frame
+        """
         global visio_control
 
         buttons = Group()
         buttons.add(self._menu_play,self._menu_options,self._menu_exit)
+        frame = 0
 
-        while True:
+        while frames is None or frame < frames:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.quitgame()
@@ -604,7 +2033,10 @@ class Menu(Game):
 
                     elif self._menu_options.is_aim(event.pos):
                         self._menu_options.press()
-                        Thread(target=visio.show_video_capture, args=(self._DISPLAY_WIDTH, self._DISPLAY_HEIGHT)).start()
+
+                        if not visio.is_running():
+                            Thread(target=visio.show_video_capture, args=(self._DISPLAY_WIDTH, self._DISPLAY_HEIGHT)).start()
+
                         # Thread(target=visio.show_control_panel).start()
                         visio_control = True
 
@@ -616,184 +2048,662 @@ class Menu(Game):
             buttons.draw(self._screen)
             buttons.update()
             pygame.display.update()
+            frame += 1
+
+            if frame == 1:
+                self.preload()
+            elif frame == 2:
+                window.set_icon('icon.png', self._backgroun_color)
 
 
 class Level(Game):
-    def __init__(self, lvl_num):
-        super(Level, self).__init__()
+    """
+       level of the game, 'layout' describes a custom level as keyword arguments
+       of Level.setup, otherwise the level is loaded by its number from the levels directory,
+       'rotation_time' is duration of the board rotation in seconds,
+       'history' is how many rotations can be taken back
+    """
+    def __init__(self, lvl_num, headless=False, layout=None, rotation_time=0.4, history=32):
+        super(Level, self).__init__(headless)
         self._lvl_num = lvl_num
+        self._layout = layout
+        self._rotation_time = rotation_time
+        self._rotation = None
+        self._rotations = []
+        self._history = deque(maxlen=history)
+        self._recorder = None
+        self._MAX_STEP = 100
+        self._hud = False
+        self._hud_img = self._hud_font = None
+        self._input = Input(self._DISPLAY_WIDTH, self._DISPLAY_HEIGHT)
+        self._input.add_button(self._pause, ('pause',))
         self._all_sprites = Group()
         self._static_sprites = Group()
         self._static_bg_sprites = Group()
         self._dynamic_sprites = Group()
+        self._numpy_physics = False
+        self.setup(**(self._layout if self._layout is not None else levels.get(self._lvl_num)))
 
-        if self._lvl_num == 1:
-            self._CELL_SIZE = 100
-            percent = self._CELL_SIZE // 100 * 10
-            self._OBJ_SIZE = (self._CELL_SIZE,self._CELL_SIZE)
-            self._PLAYER_SIZE = (self._CELL_SIZE-percent,self._CELL_SIZE-percent)
-            self._XSPEED=6
-            self._YSPEED=10
-            self.create_objects(crds_of_player=(300,300),
-                                crds_of_boxes=[(100,200),(200,200)],
-                                crds_of_blocks=[(100,100),(100,300),(300,400),(100,500),(200,500),(300,500)],
-                                crds_of_prize=(500,100),
-                                crds_of_skulls=[(500,500),(400,500),(100,400)])
-
-        elif self._lvl_num == 2:
-            self._CELL_SIZE = 100
-            percent = self._CELL_SIZE // 100 * 10
-            self._OBJ_SIZE = (self._CELL_SIZE,self._CELL_SIZE)
-            self._PLAYER_SIZE = (self._CELL_SIZE-percent,self._CELL_SIZE-percent)
-            self._XSPEED=6
-            self._YSPEED=10
-            self.create_objects(crds_of_player=(100,500),
-                                crds_of_boxes=[(100,100),(400,100)],
-                                crds_of_blocks=[(200,200),(500,100),(300,400),(500,500)],
-                                crds_of_prize=(400,100),
-                                crds_of_skulls=[(500,400)],
-                                crds_of_portals=[(400,500),(500,200)])
-
-        elif self._lvl_num == 3:
-            self._CELL_SIZE = 50
-            percent = self._CELL_SIZE // 100 * 10
-            self._OBJ_SIZE = (self._CELL_SIZE,self._CELL_SIZE)
-            self._PLAYER_SIZE = (self._CELL_SIZE-percent,self._CELL_SIZE-percent)
-            self._XSPEED=4
-            self._YSPEED=10
-            self.create_objects(crds_of_player=(50,300),
-                                crds_of_boxes=[(350,400),(350,350),(50,250),(100,100),(100,150),(150,100),(150,150),(150,50),(300,100),\
-                                              (300,50),(450,250),(450,200),(450,150),(550,50),(600,50),(550,100),(600,100)],
-                                crds_of_blocks=[(350,300),(100,50),(150,100),(200,400),(500,250),(50,350),(50,400),(50,450)],
-                                crds_of_prize=(300,250),
-                                crds_of_skulls=[(250,300),(250,250),(400,300),(500,400),(50,550),(300,150),(300,100),(600,600),(550,600),(500,600),(200,350)],
-                                crds_of_portals=[(400,500),(500,200)])
-            self._player._gravity = 0.7
+    def setup(self, cell_size, xspeed, yspeed, gravity=None, board_size=None, **crds):
+        """
+            sets sizes and speeds of the level and creates its objects, 'crds' go to create_objects,
+            'board_size' in pixels may be bigger than the window, by default the board fills it
+        """
+        self._CELL_SIZE = cell_size
+        self._BOARD_SIZE = board_size or self._DISPLAY_HEIGHT
+        self._CHUNK_SIZE = 350
+        self._camera = Camera(self._DISPLAY_WIDTH, self._DISPLAY_HEIGHT, self._BOARD_SIZE)
+        percent = self._CELL_SIZE // 100 * 10
+        self._OBJ_SIZE = (self._CELL_SIZE,self._CELL_SIZE)
+        self._PLAYER_SIZE = (self._CELL_SIZE-percent,self._CELL_SIZE-percent)
+        self._XSPEED=xspeed
+        self._YSPEED=yspeed
+        self.create_objects(**crds)
+
+        if gravity is not None:
+            self._player._gravity = gravity
 
     def track_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.quitgame()
+        """applies changes of keyboard, mouse and camera since the last frame"""
+        self._input.poll()
+        profiler.lap('events')
 
-            if event.type == pygame.KEYDOWN:
-                if event.key == 97: # a
-                    self._player.go('left', True)
-                
-                elif event.key == 100: # d
-                    self._player.go('right', True)
-                
-                elif event.key == 119\
-                and self._player.get_center()['y'] == self._player._ground : # w
-                    self._player.go('up', True)
+        if visio_control and visio is not None:
+            self._input.track_aim(*visio.get_aim())
+            profiler.lap('aim')
 
-            if event.type == pygame.KEYUP:
-                if event.key == 97:
-                    self._player.go('left', False)
-                
-                elif event.key == 100:
-                    self._player.go('right', False)
+        for action in self._input.take():
+            self.apply(action)
+
+        profiler.lap('events')
+
+    def get_input(self):
+        return self._input
+
+    def get_aim(self):
+        """returns (x, y) of the aim tracked by the camera or None"""
+        if not visio_control or visio is None:
+            return None
+
+        (found, aim_x, aim_y), _, _ = visio.get_aim()
+        return (aim_x, aim_y) if found else None
+
+    def apply(self, action):
+        """
+            applies one input action: ('go', side, pressed), ('rotate', side), ('undo',),
+            ('pause',) or ('quit',), player can start a jump only from the ground,
+            ('hud',) shows or hides the performance numbers and ('profile',) exports them,
+            these two don't change the level, so they aren't recorded,
+            a headless level has no menu or window, so it ignores ('pause',) and ('quit',)
+        """
+        if self._headless and action[0] in ('pause', 'quit'):
+            return
+
+        elif action[0] == 'hud':
+            self._hud = not self._hud
+            self._hud_img = None
+            return
+
+        elif action[0] == 'profile':
+            profiler.export()
+            return
+
+        # a jump in the air or a press of a held side does nothing, e.g. repeated by a held camera zone,
+        # so it isn't recorded either
+        if action[0] == 'go':
+            if action[1] == 'up' and action[2] and not self._player.on_ground():
+                return
+
+            if action[1] != 'up' and action[2] == self._player.can_be(action[1]):
+                return
+
+        if self._recorder is not None:
+            self._recorder.action(action)
+
+        if action[0] == 'go':
+            _, side, pressed = action
+            self._player.go(side, pressed)
+
+        elif action[0] == 'rotate':
+            self.rotate(action[1])
+
+        elif action[0] == 'undo':
+            self.undo()
+
+        elif action[0] == 'pause':
+            menu = Menu(self)
+            menu.start()
+            self._renderer.invalidate()
+
+        elif action[0] == 'quit':
+            self.quitgame()
+
+    def rotate(self, side):
+        """
+            starts rotation of the board, while another one is in progress the same side
+            is queued and the opposite one cancels the last started or queued rotation
+        """
+        if self._rotations:
+            if self._rotations[-1] != side:
+                self._rotations.pop()
+            else:
+                self._rotations.append(side)
 
-                elif event.key == pygame.K_LEFT or event.key == 122: # <- or z
-                    grid = self.place_to_grid(all_sprites)
-                    self.rotate_grid('left',grid)
+        elif self._rotation is not None:
+            if self._rotation.get_side() != side:
+                self._rotation.cancel()
 
-                elif event.key == pygame.K_RIGHT or event.key == 120: # -> or x
-                    grid = self.place_to_grid(all_sprites)
-                    self.rotate_grid('right',grid)
+                # the tween takes back only its own state from the history
+                if self._rotation.is_cancelled():
+                    self._history.pop()
+                else:
+                    self._history.append(self._rotated_from)
+            else:
+                self._rotations.append(side)
+
+        else:
+            self.start_rotation(side)
+
+    def start_rotation(self, side):
+        """remembers the state of the level for undo and starts turning the board"""
+        self._rotated_from = self.snapshot()
+        self._history.append(self._rotated_from)
+        self.smooth_movement(side, *self._board.rotate(side), follow=self._player)
+
+    def undo(self):
+        """returns the level into the state it had before the last rotation started"""
+        if self._history:
+            self.restore(self._history.pop())
+
+    def is_rotating(self):
+        return self._rotation is not None
+
+    def step(self, dt=None):
+        """
+            makes one step of the level, 'dt' is its duration in seconds (1/FPS by default),
+            physics stands still while the board is rotating
+        """
+        global physics
+
+        if self._rotation is not None:
+            if self._rotation.advance(1/self._FPS if dt is None else dt, None if self._camera.sees_all() else self.rotation_view):
+                self.finish_movement()
+
+                if self._rotations:
+                    self.start_rotation(self._rotations.pop(0))
+            return
+
+        self._camera.follow(self._player)
+        physics = self._physics
+
+        self._physics.step(self.in_sight(self._dynamic_sprites, margin=self._CHUNK_SIZE))
+
+    def rotation_view(self):
+        """returns part of the board which has to be drawn while the board is rotating"""
+        self._camera.follow(self._player)
+        return self._camera.get_view(self._CELL_SIZE)
+
+    def in_sight(self, group, margin=0):
+        """
+            returns objects of the group which lie in the chunks seen by the camera, widened by 'margin',
+            that is the whole group when the board fits into the window,
+            the result can be iterated while objects leave the group
+        """
+        if self._camera.sees_all():
+            return group.snapshot()
+
+        return self._chunks.query_box(*self._camera.get_view(margin)) & group.get()
+
+    def draw(self):
+        """
+            draws the current frame, only changed places of the screen are updated,
+            while the board is rotating all objects are drawn as the moving layer
+        """
+        aim = self.get_aim()
+
+        if self._rotation is not None:
+            static_groups, dynamic_groups = (), (self._rotation.get_moved(),)
+        else:
+            static_groups = self.in_sight(self._static_sprites), self.in_sight(self._static_bg_sprites)
+            dynamic_groups = self.in_sight(self._dynamic_sprites),
+
+        overlays = ((self._aim_img, aim),) if aim is not None else ()
+
+        if self._hud:
+            overlays += ((self.hud_image(), (self._DISPLAY_WIDTH, 60)),)
+
+        self._renderer.draw(static_groups=static_groups,
+                            dynamic_groups=dynamic_groups,
+                            overlays=overlays,
+                            static_overlays=((self._pause.get_image(), self._pause.get_coords()),),
+                            offset=self._camera.get_offset())
+
+    def hud_image(self):
+        """
+            returns the performance numbers for the side strip: fps, p50/p95/p99 of the frame time,
+            p95 of every stage and of collision checks, the image is made again every 30 frames
+        """
+        if self._hud_img is not None and profiler.get_count() - self._hud_frame < 30:
+            return self._hud_img
+
+        if self._hud_font is None:
+            self._hud_font = pygame.font.Font(None, 16)
+
+        summary = profiler.summary()
+        lines = ['%d fps' % self._clock.get_fps()]
 
-            if event.type == pygame.MOUSEBUTTONUP:
-                if self._pause.is_aim(event.pos):
-                    menu = Menu()
-                    menu.start()
+        if summary:
+            lines += ['%s %.1f' % (p, summary['frame'][p]) for p in ('p50', 'p95', 'p99')]
+            lines += ['%s %.1f' % (stage[:2], summary[stage]['p95']) for stage in Profiler.STAGES]
+            lines.append('chk %d' % summary['checks']['p95'])
 
-        if visio_control:
-            global aim_x, aim_y
+        self._hud_img = pygame.Surface((self._ADDITIONAL_WIDTH, 14*len(Profiler.STAGES) + 84))
+        self._hud_img.fill(self._backgroun_color)
 
-            if aim_x > self._DISPLAY_WIDTH//2 and aim_y > self._DISPLAY_HEIGHT//2: # ->
-                self._player.go('left', False)
-                self._player.go('right', True)
+        for i, line in enumerate(lines):
+            self._hud_img.blit(self._hud_font.render(line, True, self._green), (2, 14*i))
 
-            if aim_x < self._DISPLAY_WIDTH//2 and aim_y > self._DISPLAY_HEIGHT//2: # <-
-                self._player.go('right', False)
-                self._player.go('left', True)
+        self._hud_frame = profiler.get_count()
+        return self._hud_img
 
-            if aim_x < self._DISPLAY_WIDTH//2 and aim_y < self._DISPLAY_HEIGHT//3\
-            and self._player.get_center()['y'] == self._player._ground:  
-                self._player.go('right', False)
-                self._player.go('up', True)
-                self._player.go('left', True)
+    def get_player(self):
+        return self._player
 
-            if aim_x > self._DISPLAY_WIDTH//2 and aim_y < self._DISPLAY_HEIGHT//3\
-            and self._player.get_center()['y'] == self._player._ground:
-                self._player.go('left', False)
-                self._player.go('up', True)
-                self._player.go('right', True)
+    def get_cell_size(self):
+        return self._CELL_SIZE
+
+    def cell(self, sprite):
+        """returns (row, column) of the cell of the board which sprite is nearest to"""
+        return self._board.cell(sprite)
+
+    def grid_key(self):
+        """returns a short digest of the cells of the objects, see Board.digest"""
+        return self._board.digest()
+
+    def is_won(self):
+        return self._player.on_prize()
+
+    def is_lost(self):
+        return self._player.is_dead()
 
     def create_objects(self, crds_of_player, crds_of_blocks, crds_of_prize, crds_of_boxes=(), crds_of_skulls=(), crds_of_portals=()):
-        self._player = Player(xspeed=self._XSPEED, yspeed=self._YSPEED, size=self._PLAYER_SIZE,image=self._player_img,coords=crds_of_player)
-        self._prize = Prize(size=self._OBJ_SIZE,image=self._exit_img,coords=crds_of_prize)
+        self._player = Player(xspeed=self._XSPEED, yspeed=self._YSPEED, size=self._PLAYER_SIZE,image=assets.scaled('player.png', self._PLAYER_SIZE),coords=crds_of_player)
+        self._prize = Prize(size=self._OBJ_SIZE,image=assets.scaled('exit.jpg', self._OBJ_SIZE),coords=crds_of_prize)
         self._static_bg_sprites.add(self._prize)
         self._dynamic_sprites.add(self._player)
 
-        if crds_of_portals:
-            self._portal0 = Portal(size=self._OBJ_SIZE, portal_id=0,image=self._portal_img,coords=crds_of_portals[0],twin_coords=crds_of_portals[1])
-            self._portal1 = Portal(size=self._OBJ_SIZE, portal_id=1,image=self._portal_img,coords=crds_of_portals[1],twin_coords=crds_of_portals[0])
-            self._static_bg_sprites.add(self._portal0, self._portal1)
+        if len(crds_of_portals) % 2:
+            raise ValueError('portals of the level have to go in pairs')
+
+        portals = tuple(Portal(size=self._OBJ_SIZE,image=assets.scaled('portal.jpg', self._OBJ_SIZE),coords=coords) for coords in crds_of_portals)
+
+        for portal, twin in zip(portals[::2], portals[1::2]):
+            Portals.pair(portal, twin)
+            self._static_bg_sprites.add(portal, twin)
 
         for coords in crds_of_boxes:
-            box = Box(xspeed=self._XSPEED,yspeed=self._YSPEED,size=self._OBJ_SIZE,image=self._box_img,coords=coords)
+            box = Box(xspeed=self._XSPEED,yspeed=self._YSPEED,size=self._OBJ_SIZE,image=assets.scaled('box.jpg', self._OBJ_SIZE),coords=coords)
             self._dynamic_sprites.add(box)
 
         for coords in crds_of_blocks:
-            block = Block(size=self._OBJ_SIZE,image=self._block_img,coords=coords)
+            block = Block(size=self._OBJ_SIZE,image=assets.scaled('block.jpg', self._OBJ_SIZE),coords=coords)
             self._static_sprites.add(block)
 
         for coords in crds_of_skulls:
-            skull = Skull(size=self._OBJ_SIZE,image=self._skull_img,coords=coords)
+            skull = Skull(size=self._OBJ_SIZE,image=assets.scaled('skull.jpg', self._OBJ_SIZE),coords=coords)
             self._static_bg_sprites.add(skull)
 
         coords = set()
 
-        for j in range(self._DISPLAY_HEIGHT//self._CELL_SIZE):
+        for j in range(self._BOARD_SIZE//self._CELL_SIZE):
             coords.add((j*self._CELL_SIZE,0)) 
-            coords.add((j*self._CELL_SIZE,self._DISPLAY_HEIGHT-self._CELL_SIZE))
+            coords.add((j*self._CELL_SIZE,self._BOARD_SIZE-self._CELL_SIZE))
             coords.add((0,j*self._CELL_SIZE))
-            coords.add((self._DISPLAY_WIDTH-self._CELL_SIZE,j*self._CELL_SIZE))
+            coords.add((self._BOARD_SIZE-self._CELL_SIZE,j*self._CELL_SIZE))
 
         for c in coords: 
-            self._static_sprites.add(Block(size=self._OBJ_SIZE,image=self._frame_img,coords=c))
+            self._static_sprites.add(Block(size=self._OBJ_SIZE,image=assets.scaled('frame.jpg', self._OBJ_SIZE),coords=c))
 
         self._all_sprites.add(t=tuple(self._dynamic_sprites.get()^self._static_bg_sprites.get()^self._static_sprites.get()))
+        self._members = [(group, tuple(group.get())) for group in
+                         (self._all_sprites, self._static_sprites, self._static_bg_sprites, self._dynamic_sprites)]
+        self._fields = [(sprite, name) for sprite in self._members[0][1] for name in sprite._STATE]
+        self._flags = [isinstance(getattr(sprite, name), bool) for sprite, name in self._fields]
+        self._initial = self.snapshot()
+        self.index_objects()
+
+    def index_objects(self):
+        """
+            builds spatial hash, physics, board and chunks of the camera from the objects of the level,
+            a board which fits into the window is always seen whole, so it gets no chunks to keep up to date
+        """
+        self._sprites_hash = SpatialHash(self._CELL_SIZE, Object.SOLID | Object.DANGER | Object.PRIZE | Object.DYNAMIC)
+        self._sprites_hash.add(t=tuple(self._all_sprites.get()))
+        self._portals = Portals(self._CELL_SIZE)
+        self._portals.add(t=tuple(self._all_sprites.layer(Object.PORTAL)))
+        self._physics = Physics(self._sprites_hash, self._portals)
+        self._board = Board(self._CELL_SIZE, self._BOARD_SIZE//self._CELL_SIZE)
+        self._board.add(t=tuple(self._all_sprites.get()))
+        self._chunks = None
+
+        if not self._camera.sees_all():
+            self._chunks = SpatialHash(self._CHUNK_SIZE)
+            self._chunks.add(t=tuple(self._all_sprites.get()))
+
+        if self._numpy_physics:
+            self.use_numpy_physics()
+
+    def snapshot(self):
+        """returns coords, speeds and move flags of all objects as one flat float array"""
+        return np.array([getattr(sprite, name) for sprite, name in self._fields], dtype=float)
+
+    def restore(self, snapshot):
+        """
+            puts objects into the states of 'snapshot' in place, nothing is created again,
+            dead objects come back to their groups, rotations in progress are dropped
+        """
+        for (sprite, name), flag, value in zip(self._fields, self._flags, snapshot.tolist()):
+            setattr(sprite, name, bool(value) if flag else int(value) if value.is_integer() else value)
 
-    def start(self):
-        global all_sprites, all_without_bg
-        
-        while True:
-            all_sprites = self._all_sprites
-            all_without_bg = self._all_sprites.get()^self._static_bg_sprites.get() 
+        for sprite in self._members[0][1]:
+            sprite.clear_containers()
+
+        for group, members in self._members:
+            group.clear()
+            group.add(t=tuple(sprite for sprite in members if not sprite.is_dead()))
+
+        self._rotation = None
+        self._rotations = []
+        self.index_objects()
+
+        if not self._headless: self._renderer.invalidate()
+
+    def restart(self):
+        """puts objects back into their states at the start of the level"""
+        self.restore(self._initial)
+        self._history.clear()
 
+    def use_numpy_physics(self):
+        """switches collisions to the batched NumpyPhysics backend, it stays after restarts"""
+        self._numpy_physics = True
+        self._physics = NumpyPhysics(self._sprites_hash, self._portals)
+        self._physics.add(t=tuple(self._all_sprites.get()))
+
+    def checksum(self):
+        """returns hex digest of the level state, equal states give equal digests"""
+        return hashlib.sha1(self.snapshot().tobytes()).hexdigest()
+
+    def quitgame(self):
+        if self._recorder is not None:
+            self._recorder.save('quit', self.checksum())
+
+        super(Level, self).quitgame()
+
+    def start(self, numpy_physics=False, recorder=None):
+        """
+            'numpy_physics' switches collision checks to the batched NumpyPhysics backend,
+            'recorder' gets applied actions and durations of frames
+        """
+        self._recorder = recorder
+
+        if numpy_physics:
+            self.use_numpy_physics()
+
+        # the clock is shared by all games, so the first frame of the level takes no time
+        ms = 0
+
+        while True:
             if self._player.on_prize():
+                if recorder is not None: recorder.save('win', self.checksum())
                 self.show_message_of_win()
                 return                       
 
             elif self._player.is_dead():
                 self.show_message_of_death()
-                self.__init__(self._lvl_num)
-                self.start()
-                return
+                self.restart()
 
             else:
+                profiler.begin()
                 self.track_events()
-                self._screen.fill(self._backgroun_color)
-                self._static_sprites.draw(self._screen)
-                self._static_bg_sprites.draw(self._screen)
-                self._dynamic_sprites.draw(self._screen)
-                self._static_sprites.update()
-                self._static_bg_sprites.update()
-                self._dynamic_sprites.update()
-
-                if visio_control: self._screen.blit(self._aim_img, (aim_x, aim_y))
-
-                self._screen.blit(self._pause.get_image(), self._pause.get_coords())
-                pygame.display.update()
-                self._clock.tick(self._FPS)
+                self.draw()
+                self.step(ms/1000)
+                profiler.lap('update')
+                profiler.end(self._physics.take_checks())
+                if recorder is not None: recorder.step(ms)
+                # the pause menu and messages block the loop, the time they took isn't played
+                ms = min(self._clock.tick(self._FPS), self._MAX_STEP)
+
+
+class Simulation(object):
+    """
+       runs level physics without window, rendering and sleeping,
+       'script' is a sequence of (frame, action) pairs with actions as in Level.apply,
+       'steps' are durations of frames in milliseconds (1/FPS by default),
+       with 'respawn' the level restarts after a death like in Level.start
+    """
+    def __init__(self, lvl_num, script=(), max_frames=3600, numpy_physics=False, layout=None, steps=None, respawn=False):
+        self._level = Level(lvl_num, headless=True, layout=layout)
+        self._script = {}
+        self._max_frames = max_frames
+        self._steps = steps
+        self._respawn = respawn
+
+        for frame, action in script:
+            self._script.setdefault(frame, []).append(tuple(action))
+
+        if numpy_physics:
+            self._level.use_numpy_physics()
+
+    def get_level(self):
+        return self._level
+
+    def run(self):
+        """returns ('win' | 'death' | 'timeout', number of stepped frames)"""
+        for frame in range(self._max_frames + 1):
+            if self._level.is_won():
+                return 'win', frame
+
+            if self._level.is_lost():
+                if not self._respawn:
+                    return 'death', frame
+
+                self._level.restart()
+
+            for action in self._script.get(frame, ()):
+                self._level.apply(action)
+
+            # actions after the last frame came e.g. together with closing of the window
+            if frame == self._max_frames:
+                return 'timeout', frame
+
+            self._level.step(self._steps[frame]/1000 if self._steps is not None else None)
+
+
+# level of the solver process, every process of the pool keeps its own copy
+solver_level = None
+
+def start_solver_process(lvl_num, layout):
+    global solver_level
+    solver_level = Level(lvl_num, headless=True, layout=layout)
+
+def play_solver_move(task):
+    snapshot, move = task
+    solver_level.restore(snapshot)
+    return Solver.play(solver_level, move)
+
+
+class Solver(object):
+    """
+       finds the shortest solution of a level by breadth first search over moves of the player:
+       a step to the next cell, a jump to a side and a rotation of the board,
+       after every move the level runs till nothing changes, so the states are the ones of the game,
+       the frontier is spread over a process pool ('processes' is the number of cores by default),
+       states met before are found in the transposition table by a short digest of the cells of their objects
+    """
+    MOVES = ('left', 'right', 'jump_left', 'jump_right', 'rotate_left', 'rotate_right')
+
+    def __init__(self, lvl_num, layout=None, processes=None, max_depth=40, max_states=100000):
+        self._lvl_num = lvl_num
+        self._layout = layout
+        self._processes = processes
+        self._max_depth = max_depth
+        self._max_states = max_states
+        self._table = {}
+        self._settling = (), 0
+        self._solution = None
+
+    @staticmethod
+    def play(level, move, limit=600):
+        """
+            plays 'move' from the current state of the level, None just waits,
+            returns (outcome, key, snapshot, script, frames),
+            outcome is 'win', 'death', 'stuck' (the move can't be made or nothing stops in 'limit' frames)
+            or 'settled', only a settled move has the grid key of its state and its snapshot,
+            'script' holds actions with frames from the start of the move as in Simulation
+        """
+        player = level.get_player()
+        kind, side = move.split('_') if move and '_' in move else ('go', move)
+        cell = level.get_cell_size()
+        script = []
+
+        def act(action):
+            script.append([frame, list(action)])
+            level.apply(action)
+
+        if move is None:
+            kind, presses = 'wait', ()
+
+        elif kind == 'go':
+            presses = (('go', side, True),)
+            target = (level.cell(player)[1] + (1 if side == 'right' else -1))*cell
+
+        elif kind == 'jump':
+            if not player.on_ground():
+                return 'stuck', None, None, script, 0
+
+            presses = (('go', side, True), ('go', 'up', True))
+
+        else:
+            presses = (('rotate', side),)
+
+        frame = 0
+        for action in presses:
+            act(action)
+
+        last = x = None
+
+        while frame < limit:
+            if kind == 'jump' and frame and not player.can_be('up') and player.on_ground():
+                # landed, the player goes on to the nearest cell ahead
+                kind = 'go'
+                landed = player.get_coords()[0]
+                target = (-(-landed//cell) if side == 'right' else landed//cell)*cell
+
+            if kind == 'go':
+                # a step ends on the frame nearest to its cell, so steps don't drift off the grid,
+                # a wall ends it earlier
+                previous, x = x, player.get_coords()[0]
+
+                if fabs(target - x) <= player.get_xspeed()/2 or x == previous:
+                    kind = 'stepped'
+                    act(('go', side, False))
+
+            level.step()
+            frame += 1
+
+            if level.is_won():
+                return 'win', None, None, script, frame
+
+            if level.is_lost():
+                return 'death', None, None, script, frame
+
+            if kind not in ('go', 'jump') and not level.is_rotating():
+                snapshot = level.snapshot()
+
+                if last is not None and np.array_equal(snapshot, last):
+                    return 'settled', level.grid_key(), snapshot, script, frame
+
+                last = snapshot
+
+        return 'stuck', None, None, script, frame
+
+    def solve(self):
+        """returns moves which win the level or None when the limits are over before"""
+        start_solver_process(self._lvl_num, self._layout)
+        # objects may be falling at the start
+        outcome, key, root, script, frames = self.play(solver_level, None)
+        # key of the state -> (key of the previous state, move, script, frames)
+        self._table = {key: None} if outcome == 'settled' else {}
+        self._solution = [(None, script, frames)] if outcome == 'win' else None
+        self._settling = script, frames
+
+        if outcome != 'settled':
+            return [] if outcome == 'win' else None
+
+        frontier = [(key, root)]
+        processes = self._processes or os.cpu_count() or 1
+        pool = Pool(processes, start_solver_process, (self._lvl_num, self._layout)) if processes > 1 else None
+
+        try:
+            for depth in range(self._max_depth):
+                tasks = [(snapshot, move) for _, snapshot in frontier for move in self.MOVES]
+
+                if pool is not None:
+                    results = pool.map(play_solver_move, tasks, chunksize=max(1, len(tasks)//(4*processes)))
+                else:
+                    results = map(play_solver_move, tasks)
+
+                following = []
+
+                for i, (outcome, key, snapshot, script, frames) in enumerate(results):
+                    parent, move = frontier[i//len(self.MOVES)][0], self.MOVES[i%len(self.MOVES)]
+
+                    if outcome == 'win':
+                        self._solution = self.path(parent) + [(move, script, frames)]
+                        return [move for move, _, _ in self._solution[1:]]
+
+                    if outcome == 'settled' and key not in self._table:
+                        self._table[key] = parent, move, script, frames
+                        following.append((key, snapshot))
+
+                if not following or len(self._table) > self._max_states:
+                    return None
+
+                frontier = following
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        return None
+
+    def path(self, key):
+        """returns (move, script, frames) from the start of the level to the state 'key', the first move is None"""
+        path = []
+
+        while self._table[key] is not None:
+            key, move, script, frames = self._table[key]
+            path.append((move, script, frames))
+
+        return [(None,) + self._settling] + path[::-1]
+
+    def get_explored(self):
+        """returns number of different states met by the last search"""
+        return len(self._table)
+
+    def get_replay(self):
+        """returns the found solution as a replay of headless.py or None"""
+        if self._solution is None:
+            return None
+
+        script, start = [], 0
+
+        for move, actions, frames in self._solution:
+            script.extend([start + frame, action] for frame, action in actions)
+            start += frames
+
+        replay = {'level': self._lvl_num, 'max_frames': start + 1, 'script': script}
+
+        if self._layout is not None:
+            replay['layout'] = self._layout
+
+        return replay
@@ -0,0 +1,78 @@
+import json
+import time
+import argparse
+from classes import Cv, BlobSource, open_source
+from benchmark import percentiles
+
+STAGES = 'resize', 'blur', 'hsv', 'mask', 'contour', 'adapt'
+
+
+def run(source, frames, scale, track=True, adapt=True):
+    """processes frames one by one, returns statistics of stages, throughput and accuracy"""
+    cv = Cv(scale=scale, track=track, adapt=adapt)
+    stages = {stage: [] for stage in STAGES}
+    total, errors, found = [], [], 0
+
+    for n in range(frames):
+        ok, frame = source.read()
+        if not ok: break
+
+        timings = {}
+        start = time.perf_counter()
+        rect = cv.find_aim(frame, timings)
+        total.append(time.perf_counter() - start)
+
+        for stage in STAGES:
+            stages[stage].append(timings.get(stage, 0))
+
+        if rect is not None:
+            found += 1
+
+        truth = source.get_truth() if hasattr(source, 'get_truth') else None
+
+        if truth is not None and rect is not None:
+            x, y, w, h = rect
+            errors.append(((x + w/2 - truth[0])**2 + (y + h/2 - truth[1])**2)**0.5)
+
+    result = {'frames': len(total), 'fps': len(total)/sum(total) if total else 0,
+              'total': percentiles(total), 'detected': found/len(total) if total else 0}
+    result.update((stage, percentiles(times)) for stage, times in stages.items())
+
+    if errors:
+        errors.sort()
+        result['error_px'] = {'mean': sum(errors)/len(errors), 'p95': errors[min(len(errors)-1, int(0.95*len(errors)))],
+                              'max': errors[-1]}
+
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='throughput and accuracy of the camera tracking')
+    parser.add_argument('--source', default='synthetic',
+                        help='"synthetic", camera index, video file or directory of images')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--scale', type=float, default=0.5)
+    parser.add_argument('--dim', type=float, default=0.0, help='how much the light fades in the synthetic run')
+    parser.add_argument('--no-track', action='store_true', help='search the whole frame every time')
+    parser.add_argument('--no-adapt', action='store_true', help='keep HSV bounds static')
+    parser.add_argument('--output', default='cv_bench_results.json')
+    args = parser.parse_args()
+
+    if args.source == 'synthetic':
+        source = BlobSource(frames=args.frames, dim=args.dim)
+    else:
+        source = open_source(int(args.source) if args.source.isdigit() else args.source)
+
+    result = run(source, args.frames, args.scale, not args.no_track, not args.no_adapt)
+    source.release()
+
+    print('%d frames, %.1f fps, detected %.0f%%' % (result['frames'], result['fps'], result['detected']*100))
+
+    for stage in STAGES:
+        print('%-8s mean %.3f p95 %.3f ms' % (stage, result[stage]['mean'], result[stage]['p95']))
+
+    if 'error_px' in result:
+        print('aim error mean %.1f p95 %.1f px' % (result['error_px']['mean'], result['error_px']['p95']))
+
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
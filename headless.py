@@ -0,0 +1,23 @@
+import sys
+import json
+import time
+from classes import Simulation
+
+if __name__ == '__main__':
+    # every argument is a json file: {"level": 1, "max_frames": 3600, "script": [[frame, ["go", "right", true]], ...]},
+    # recorded runs also have "steps" (duration of every frame in ms), "respawn", "result" and "checksum"
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            replay = json.load(f)
+
+        simulation = Simulation(replay['level'], replay.get('script', ()), replay.get('max_frames', 3600),
+                                layout=replay.get('layout'), steps=replay.get('steps'), respawn=replay.get('respawn', False))
+        start = time.perf_counter()
+        result, frames = simulation.run()
+        elapsed = time.perf_counter() - start
+        played = sum(replay['steps'][:frames])/1000 if replay.get('steps') else frames/60
+        print(path, result, frames, '%.2f s, %.0fx real time' % (elapsed, played/elapsed if elapsed else 0))
+
+        if 'checksum' in replay:
+            same = simulation.get_level().checksum() == replay['checksum']
+            print('  state', 'matches the recording' if same else 'DIFFERS from the recording')
@@ -1,6 +1,11 @@
+import argparse
 from classes import Game
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run - rotate')
+    parser.add_argument('--record', metavar='DIR', help='record runs of levels to this directory for headless.py')
+    args = parser.parse_args()
+
     game = Game()
 
-    game.main()
+    game.main(record_dir=args.record)
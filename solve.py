@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import time
+import argparse
+from classes import Solver
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='finds the shortest solutions of levels')
+    parser.add_argument('levels', nargs='+', help='numbers of levels or json files with a layout of a level')
+    parser.add_argument('--processes', type=int, default=None, help='all cores by default')
+    parser.add_argument('--max-depth', type=int, default=40, help='the longest solution in moves')
+    parser.add_argument('--max-states', type=int, default=100000)
+    parser.add_argument('--replays', metavar='DIR', help='save solutions as replays of headless.py to this directory')
+    args = parser.parse_args()
+
+    unsolved = 0
+
+    for name in args.levels:
+        layout = None
+
+        if name.endswith('.json'):
+            with open(name) as f:
+                layout = json.load(f)
+
+        solver = Solver(0 if layout else int(name), layout, args.processes, args.max_depth, args.max_states)
+        start = time.perf_counter()
+        moves = solver.solve()
+        elapsed = time.perf_counter() - start
+
+        if moves is None:
+            unsolved += 1
+            print(name, 'no solution, %d states, %.1f s' % (solver.get_explored(), elapsed))
+            continue
+
+        print(name, '%d moves, %d states, %.1f s:' % (len(moves), solver.get_explored(), elapsed), ' '.join(moves))
+
+        if args.replays:
+            os.makedirs(args.replays, exist_ok=True)
+
+            with open(os.path.join(args.replays, os.path.basename(name).replace('.json', '') + '.json'), 'w') as f:
+                json.dump(solver.get_replay(), f)
+
+    sys.exit(1 if unsolved else 0)
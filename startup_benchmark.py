@@ -0,0 +1,76 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+def child():
+    """does what main.py does before the menu shows up, prints wall clock times of the stages"""
+    marks = {'start': time.time()}
+    import pygame
+    marks['pygame'] = time.time()
+    import classes
+    marks['import'] = time.time()
+    classes.Game()
+    classes.visio = classes.Cv()
+    marks['game'] = time.time()
+    menu = classes.Menu()
+    marks['menu'] = time.time()
+    menu.start(frames=1)
+    marks['frame'] = time.time()
+    print(json.dumps(marks))
+
+
+def run(runs):
+    """
+        returns statistics of the stages over 'runs' fresh processes, 'total' is from spawning to the first menu frame,
+        'startup' is the part of it which the game controls: from the import of classes to the first menu frame,
+        the interpreter and pygame, which imports pkg_resources, are left out
+    """
+    # benchmark imports classes, so the child mustn't get it before its first mark
+    from benchmark import percentiles
+
+    stages = {'interpreter': [], 'pygame': [], 'import': [], 'game': [], 'menu': [], 'frame': [], 'startup': [], 'total': []}
+
+    for i in range(runs):
+        spawned = time.time()
+        output = subprocess.run([sys.executable, __file__, '--child'], check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        marks = json.loads(output.splitlines()[-1])
+        stages['interpreter'].append(marks['start'] - spawned)
+        stages['startup'].append(marks['frame'] - marks['pygame'])
+        stages['total'].append(marks['frame'] - spawned)
+
+        for previous, stage in zip(('start', 'pygame', 'import', 'game', 'menu'), ('pygame', 'import', 'game', 'menu', 'frame')):
+            stages[stage].append(marks[stage] - marks[previous])
+
+    return {stage: percentiles(times) for stage, times in stages.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time from the start of the game to the first frame of the menu')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=100, help='limit of p50 of the startup time in ms')
+    parser.add_argument('--output', default='startup_results.json')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        sys.exit(0)
+
+    results = run(args.runs)
+
+    for stage, stats in results.items():
+        print('%-12s p50 %.1f p95 %.1f ms' % (stage, stats['p50'], stats['p95']))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if results['startup']['p50'] > args.budget:
+        print('over budget: startup p50 = %.1f ms > %.1f ms' % (results['startup']['p50'], args.budget))
+        sys.exit(1)